@@ -1,26 +1,40 @@
 import os
 import csv
 import random
+import threading
 from functools import wraps
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask_session import Session
+from cachelib import FileSystemCache
 from werkzeug.security import generate_password_hash, check_password_hash
-from PyPDF2 import PdfReader
+import pypdfium2 as pdfium
 
 # Importer la configuration
 from config import API_PROVIDER, ANTHROPIC_API_KEY, GOOGLE_API_KEY, OPENAI_API_KEY, MODELS
+try:
+    from config import PASSWORD_HASH_METHOD
+except ImportError:
+    # Anciens config.py sans ce paramètre : méthode par défaut de Werkzeug
+    PASSWORD_HASH_METHOD = 'scrypt'
+
+try:
+    from config import SESSION_FILE_THRESHOLD
+except ImportError:
+    # Au-delà de ce nombre de fichiers, cachelib supprime des sessions encore valides
+    SESSION_FILE_THRESHOLD = 100000
 
 # Importer les fonctions de la base de données
 from database import (
     init_database, get_user_by_username, create_user,
     get_all_decks, get_user_decks, get_deck_by_name, create_deck,
-    get_flashcards_by_deck, create_flashcard,
-    get_all_user_progress, update_progress, get_user_progress,
+    iter_flashcards_by_deck, create_flashcards_bulk,
+    get_all_user_progress, update_progress, get_user_progress, transaction,
     get_user_prompt, save_user_prompt, get_user_statistics,
     get_user_flashcard_counts, create_folder, get_user_folders,
-    get_decks_in_folder, move_deck_to_folder, get_folder_statistics,
-    get_deck_statistics, rename_folder, delete_folder,
+    get_decks_in_folder, move_deck_to_folder, get_user_deck_statistics,
+    rename_folder, delete_folder,
     get_user_streak, update_daily_activity, get_yearly_activity,
-    get_leaderboard, toggle_leaderboard_visibility, can_see_leaderboard,
+    get_leaderboard, toggle_leaderboard_visibility,
     get_show_in_leaderboard, get_user_security_question, verify_security_answer,
     update_user_password
 )
@@ -31,8 +45,15 @@ from datetime import datetime
 
 app = Flask(__name__)
 app.secret_key = 'CLE_SECRETE_A_CHANGER'
+app.config['PASSWORD_HASH_METHOD'] = PASSWORD_HASH_METHOD
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Sessions stockées côté serveur : le cookie ne contient plus qu'un identifiant
+app.config['SESSION_TYPE'] = 'cachelib'
+app.config['SESSION_CACHELIB'] = FileSystemCache(
+    cache_dir=os.path.join(BASE_DIR, 'flask_session'), threshold=SESSION_FILE_THRESHOLD)
+Session(app)
+
 # Dossier pour les flashcards CSV (pour la génération depuis PDF)
 FLASHCARDS_DIR = os.path.join(BASE_DIR, 'flashcards_data')
 os.makedirs(FLASHCARDS_DIR, exist_ok=True)
@@ -110,6 +131,29 @@ def login_required(f):
 
 # --- GENERATION FLASHCARDS DEPUIS PDF ---
 
+# Clients API réutilisés d'une requête à l'autre (pool de connexions HTTP conservé)
+_API_CLIENTS = {}
+
+def get_openai_client(api_key):
+    """Retourne le client OpenAI associé à cette clé, créé une seule fois"""
+    client = _API_CLIENTS.get(('openai', api_key))
+    if client is None:
+        from openai import OpenAI
+        client = _API_CLIENTS[('openai', api_key)] = OpenAI(api_key=api_key)
+    return client
+
+def get_anthropic_client(api_key):
+    """Retourne le client Anthropic associé à cette clé, créé une seule fois"""
+    client = _API_CLIENTS.get(('claude', api_key))
+    if client is None:
+        from anthropic import Anthropic
+        client = _API_CLIENTS[('claude', api_key)] = Anthropic(api_key=api_key)
+    return client
+
+# PDFium n'est pas thread-safe et le serveur traite les requêtes dans
+# plusieurs threads : un seul appel à PDFium à la fois
+_PDFIUM_LOCK = threading.Lock()
+
 def extraire_texte_pdf(pdf_path, page_range=None):
     """Extrait le texte d'un fichier PDF
 
@@ -119,23 +163,28 @@ def extraire_texte_pdf(pdf_path, page_range=None):
                    Si None, extrait toutes les pages
     """
     try:
-        reader = PdfReader(pdf_path)
-        texte_complet = ""
-
-        # Déterminer les pages à extraire
-        if page_range:
-            page_debut, page_fin = page_range
-            # Convertir en 0-indexed et s'assurer que c'est dans les limites
-            page_debut = max(0, page_debut - 1)
-            page_fin = min(len(reader.pages), page_fin)
-            pages_to_extract = range(page_debut, page_fin)
-        else:
-            pages_to_extract = range(len(reader.pages))
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(pdf_path)
+            try:
+                # Déterminer les pages à extraire
+                if page_range:
+                    page_debut, page_fin = page_range
+                    # Convertir en 0-indexed et s'assurer que c'est dans les limites
+                    page_debut = max(0, page_debut - 1)
+                    page_fin = min(len(pdf), page_fin)
+                    pages_to_extract = range(page_debut, page_fin)
+                else:
+                    pages_to_extract = range(len(pdf))
 
-        for i in pages_to_extract:
-            texte_complet += reader.pages[i].extract_text() + "\n"
+                # Extraction faite en C par PDFium (bien plus rapide que PyPDF2).
+                # PDFium renvoie des fins de ligne \r\n : ramenées à \n comme avec
+                # PyPDF2 (texte des prompts, longueurs utilisées pour tronquer)
+                parties = [pdf[i].get_textpage().get_text_bounded().replace('\r\n', '\n')
+                           for i in pages_to_extract]
+            finally:
+                pdf.close()
 
-        return texte_complet
+        return "".join(partie + "\n" for partie in parties)
     except Exception as e:
         print(f"Erreur lors de l'extraction du PDF: {e}")
         return None
@@ -189,14 +238,12 @@ NE PAS répéter ou paraphraser ces questions existantes!"""
     try:
         if API_PROVIDER == 'claude':
             # Utiliser l'API Claude (Anthropic)
-            from anthropic import Anthropic
-
             if ANTHROPIC_API_KEY == 'votre-cle-api-claude-ici':
                 print("⚠️  Clé API Claude non configurée - Génération de flashcards d'exemple")
                 return generer_flashcards_exemple(nb_flashcards), None
 
             print(f"📡 Appel API Claude ({MODELS['claude']}) - max_tokens: {max_tokens}")
-            client = Anthropic(api_key=ANTHROPIC_API_KEY)
+            client = get_anthropic_client(ANTHROPIC_API_KEY)
             response = client.messages.create(
                 model=MODELS['claude'],
                 max_tokens=max_tokens,
@@ -228,14 +275,12 @@ NE PAS répéter ou paraphraser ces questions existantes!"""
 
         elif API_PROVIDER == 'openai':
             # Utiliser l'API OpenAI
-            from openai import OpenAI
-
             if OPENAI_API_KEY == 'votre-cle-api-openai-ici':
                 print("⚠️  Clé API OpenAI non configurée - Génération de flashcards d'exemple")
                 return generer_flashcards_exemple(nb_flashcards), None
 
             print(f"📡 Appel API OpenAI ({MODELS['openai']}) - max_tokens: {max_tokens}")
-            client = OpenAI(api_key=OPENAI_API_KEY)
+            client = get_openai_client(OPENAI_API_KEY)
             response = client.chat.completions.create(
                 model=MODELS['openai'],
                 messages=[
@@ -316,9 +361,10 @@ def sauvegarder_flashcards_db(flashcards, nom_deck, user_id):
         # Créer ou récupérer le deck pour cet utilisateur
         deck_id = create_deck(nom_deck, user_id)
 
-        # Ajouter les flashcards
-        for card in flashcards:
-            create_flashcard(deck_id, card['question'], card['reponse'])
+        # Ajouter les flashcards (une seule transaction)
+        create_flashcards_bulk(
+            deck_id, [(card['question'], card['reponse']) for card in flashcards]
+        )
 
         return True
     except Exception as e:
@@ -341,47 +387,27 @@ def piocher_carte(deck_name, user_id):
 
     now = datetime.now()
 
-    # Filtrer les cartes à réviser
-    cartes_a_reviser = []
-    for carte in cartes_progress:
-        # Nouvelle carte (pas de progression)
-        if carte['due_date'] is None:
-            cartes_a_reviser.append((carte, 0))  # Priorité max
-        else:
-            # Carte existante
-            due_date = datetime.fromisoformat(carte['due_date'])
-            if due_date <= now:
-                # Carte due
-                delay = (now - due_date).total_seconds() / 3600  # En heures
-                cartes_a_reviser.append((carte, delay))
-
-    # S'il n'y a pas de cartes à réviser, on prend les prochaines cartes
-    if not cartes_a_reviser:
-        for carte in cartes_progress:
-            if carte['due_date'] is not None:
-                due_date = datetime.fromisoformat(carte['due_date'])
-                delay = -(due_date - now).total_seconds() / 3600  # Négatif = futur
-                cartes_a_reviser.append((carte, delay))
-
-    if not cartes_a_reviser:
-        return None
+    def priorite(carte):
+        """Retard en heures (négatif = carte future, 0 pour une nouvelle carte)"""
+        if carte.due_date is None:
+            return 0
+        return (now - datetime.fromisoformat(carte.due_date)).total_seconds() / 3600
 
-    # Trier par priorité (nouvelles cartes d'abord, puis cartes en retard)
-    cartes_a_reviser.sort(key=lambda x: x[1], reverse=True)
-
-    # Prendre la carte la plus prioritaire
-    carte = cartes_a_reviser[0][0]
+    # Les cartes nouvelles ou dues ont une priorité >= 0 et passent donc avant les
+    # cartes futures ; à défaut, la carte future la plus proche est choisie.
+    # Une seule passe (chaque date n'est lue qu'une fois) au lieu d'un tri complet.
+    carte = max(cartes_progress, key=priorite)
 
     return {
-        'id': carte['id'],
-        'question': carte['question'],
-        'reponse': carte['answer'],
-        'ease_factor': carte['ease_factor'],
-        'interval': carte['interval'],
-        'due_date': carte['due_date'],
-        'step': carte['step'],
-        'is_learning': carte['is_learning'],
-        'repetitions': carte['repetitions']
+        'id': carte.id,
+        'question': carte.question,
+        'reponse': carte.answer,
+        'ease_factor': carte.ease_factor,
+        'interval': carte.interval,
+        'due_date': carte.due_date,
+        'step': carte.step,
+        'is_learning': carte.is_learning,
+        'repetitions': carte.repetitions
     }
 
 # --- ROUTES AUTHENTIFICATION ---
@@ -446,9 +472,10 @@ def register():
             flash("Cet identifiant est déjà pris")
         else:
             # Création du compte
-            password_hash = generate_password_hash(password)
+            hash_method = app.config['PASSWORD_HASH_METHOD']
+            password_hash = generate_password_hash(password, method=hash_method)
             # Hash de la réponse de sécurité (en minuscule pour éviter les problèmes de casse)
-            security_answer_hash = generate_password_hash(security_answer)
+            security_answer_hash = generate_password_hash(security_answer, method=hash_method)
             user_id = create_user(username, password_hash, security_question, security_answer_hash)
             session['user'] = username
             session['user_id'] = user_id
@@ -517,7 +544,8 @@ def reset_password(username):
             # Vérifier la réponse de sécurité
             if verify_security_answer(username, security_answer):
                 # Réponse correcte, mettre à jour le mot de passe
-                new_password_hash = generate_password_hash(new_password)
+                new_password_hash = generate_password_hash(
+                    new_password, method=app.config['PASSWORD_HASH_METHOD'])
                 update_user_password(username, new_password_hash)
                 flash("Mot de passe réinitialisé avec succès ! Vous pouvez maintenant vous connecter.")
                 return redirect(url_for('login'))
@@ -625,32 +653,48 @@ def fiches():
 
 # --- ROUTES FLASHCARDS ---
 
-def build_folder_tree(user_id, parent_id=None):
+def sum_stats(stats_list):
+    """Additionne des statistiques nouvelles/réapprendre/réviser"""
+    total = {'new': 0, 'relearn': 0, 'review': 0}
+    for stats in stats_list:
+        for key in total:
+            total[key] += stats[key]
+    return total
+
+
+def deck_entry(deck, deck_stats):
+    """Construit l'entrée d'un deck pour le menu, avec ses statistiques"""
+    return {
+        'id': deck['id'],
+        'name': deck['name'],
+        'type': 'deck',
+        'stats': deck_stats.get(deck['id'], sum_stats([]))
+    }
+
+
+def build_folder_tree(user_id, parent_id=None, deck_stats=None):
     """Construit récursivement l'arborescence des dossiers avec leurs statistiques"""
+    # Statistiques de tous les decks calculées une seule fois pour tout l'arbre
+    if deck_stats is None:
+        deck_stats = get_user_deck_statistics(user_id)
+
     folders = get_user_folders(user_id, parent_id)
     result = []
 
     for folder in folders:
-        folder_dict = {
+        # Récupérer les decks dans ce dossier
+        decks = [deck_entry(deck, deck_stats)
+                 for deck in get_decks_in_folder(user_id, folder['id'])]
+
+        result.append({
             'id': folder['id'],
             'name': folder['name'],
             'type': 'folder',
-            'stats': get_folder_statistics(user_id, folder['id']),
-            'children': build_folder_tree(user_id, folder['id']),
-            'decks': []
-        }
-
-        # Récupérer les decks dans ce dossier
-        decks = get_decks_in_folder(user_id, folder['id'])
-        for deck in decks:
-            folder_dict['decks'].append({
-                'id': deck['id'],
-                'name': deck['name'],
-                'type': 'deck',
-                'stats': get_deck_statistics(user_id, deck['id'])
-            })
-
-        result.append(folder_dict)
+            # Statistiques du dossier : somme de ses decks directs
+            'stats': sum_stats(deck['stats'] for deck in decks),
+            'children': build_folder_tree(user_id, folder['id'], deck_stats),
+            'decks': decks
+        })
 
     return result
 
@@ -661,22 +705,18 @@ def flashcards_menu():
     """Affiche la liste des decks de l'utilisateur avec arborescence"""
     user_id = session.get('user_id')
 
+    # Statistiques de tous les decks en une seule requête
+    deck_stats = get_user_deck_statistics(user_id)
+
     # Construire l'arborescence des dossiers
-    folder_tree = build_folder_tree(user_id)
+    folder_tree = build_folder_tree(user_id, deck_stats=deck_stats)
 
     # Récupérer les decks à la racine (sans dossier)
-    root_decks = get_decks_in_folder(user_id, None)
-    root_decks_list = []
-    for deck in root_decks:
-        root_decks_list.append({
-            'id': deck['id'],
-            'name': deck['name'],
-            'type': 'deck',
-            'stats': get_deck_statistics(user_id, deck['id'])
-        })
+    root_decks_list = [deck_entry(deck, deck_stats)
+                       for deck in get_decks_in_folder(user_id, None)]
 
-    # Récupérer les statistiques globales
-    global_stats = get_user_flashcard_counts(user_id)
+    # Statistiques globales : somme de tous les decks
+    global_stats = sum_stats(deck_stats.values())
 
     return render_template('flashcards_menu.html',
                          folder_tree=folder_tree,
@@ -761,43 +801,47 @@ def vote_card():
         flashcard_id = int(flashcard_id)
         rating = int(rating)
 
-        # Récupérer la progression actuelle
-        progress = get_user_progress(user_id, flashcard_id)
-
-        # Créer l'objet AnkiCard
-        if progress:
-            card = AnkiCard(
-                ease_factor=progress['ease_factor'],
-                interval=progress['interval'],
-                due_date=datetime.fromisoformat(progress['due_date']) if progress['due_date'] else None,
-                step=progress['step'],
-                is_learning=bool(progress['is_learning']),
-                repetitions=progress['repetitions']
+        # Lecture de la progression, mise à jour et activité du jour dans une
+        # seule transaction : un seul commit, et pas de vote concurrent perdu
+        with transaction() as conn:
+            # Récupérer la progression actuelle
+            progress = get_user_progress(user_id, flashcard_id, conn=conn)
+
+            # Créer l'objet AnkiCard
+            if progress:
+                card = AnkiCard(
+                    ease_factor=progress['ease_factor'],
+                    interval=progress['interval'],
+                    due_date=datetime.fromisoformat(progress['due_date']) if progress['due_date'] else None,
+                    step=progress['step'],
+                    is_learning=bool(progress['is_learning']),
+                    repetitions=progress['repetitions']
+                )
+            else:
+                # Nouvelle carte
+                card = AnkiCard()
+
+            # Calculer le prochain intervalle avec l'algorithme Anki
+            new_card = calculate_next_review(card, rating)
+
+            # Sauvegarder la nouvelle progression
+            update_progress(
+                user_id,
+                flashcard_id,
+                new_card.ease_factor,
+                new_card.interval,
+                new_card.due_date.isoformat(),
+                new_card.step,
+                1 if new_card.is_learning else 0,
+                new_card.repetitions,
+                conn=conn
             )
-        else:
-            # Nouvelle carte
-            card = AnkiCard()
-
-        # Calculer le prochain intervalle avec l'algorithme Anki
-        new_card = calculate_next_review(card, rating)
-
-        # Sauvegarder la nouvelle progression
-        update_progress(
-            user_id,
-            flashcard_id,
-            new_card.ease_factor,
-            new_card.interval,
-            new_card.due_date.isoformat(),
-            new_card.step,
-            1 if new_card.is_learning else 0,
-            new_card.repetitions
-        )
 
-        # Mettre à jour l'activité quotidienne
-        # Vérifier si toutes les cartes dues sont terminées
-        stats = get_user_flashcard_counts(user_id)
-        all_completed = (stats['new'] == 0 and stats['relearn'] == 0 and stats['review'] == 0)
-        update_daily_activity(user_id, 1, all_completed)
+            # Mettre à jour l'activité quotidienne
+            # Vérifier si toutes les cartes dues sont terminées
+            stats = get_user_flashcard_counts(user_id, conn=conn)
+            all_completed = (stats['new'] == 0 and stats['relearn'] == 0 and stats['review'] == 0)
+            update_daily_activity(user_id, 1, all_completed, conn=conn)
 
     # Piocher la carte suivante
     nouvelle_carte = piocher_carte(deck_name, user_id)
@@ -885,8 +929,9 @@ def generer_flashcards_from_pdf():
         existing_deck = get_deck_by_name(nom_deck)
         if existing_deck and existing_deck['user_id'] == user_id:
             print(f"📚 Deck existant détecté - récupération des questions pour éviter les doublons")
-            existing_cards = get_flashcards_by_deck(existing_deck['id'])
-            existing_questions = [card['question'] for card in existing_cards]
+            existing_questions = [
+                card['question'] for card in iter_flashcards_by_deck(existing_deck['id'])
+            ]
             print(f"📝 {len(existing_questions)} questions existantes dans le deck")
 
         # Déterminer le prompt à utiliser (priorité: éphémère > personnalisé > défaut)
@@ -1102,8 +1147,10 @@ def leaderboard():
     """Page du classement des utilisateurs"""
     user_id = session.get('user_id')
 
-    # Vérifier si l'utilisateur peut voir le classement
-    can_view = can_see_leaderboard(user_id)
+    # Vérifier si l'utilisateur est visible : seul un utilisateur visible
+    # peut voir le classement (une seule requête pour les deux)
+    show_in_leaderboard = get_show_in_leaderboard(user_id)
+    can_view = show_in_leaderboard == 1
 
     if can_view:
         # Récupérer le classement
@@ -1111,9 +1158,6 @@ def leaderboard():
     else:
         leaderboard_data = []
 
-    # Vérifier si l'utilisateur est visible
-    show_in_leaderboard = get_show_in_leaderboard(user_id)
-
     return render_template('leaderboard.html',
                           leaderboard=leaderboard_data,
                           can_view=can_view,
@@ -1182,13 +1226,14 @@ def creer_flashcard_manuelle():
         deck_id = create_deck(nom_deck, user_id)
 
         # Créer la flashcard principale
-        create_flashcard(deck_id, question, reponse)
-        cards_created = 1
+        cartes = [(question, reponse)]
 
         # Si bidirectionnel, créer aussi la carte inverse
         if bidirectional:
-            create_flashcard(deck_id, reponse, question)
-            cards_created = 2
+            cartes.append((reponse, question))
+
+        create_flashcards_bulk(deck_id, cartes)
+        cards_created = len(cartes)
 
         return jsonify({
             'success': True,
@@ -1487,14 +1532,12 @@ def generer_fiche_via_api(texte):
 
     try:
         if API_PROVIDER == 'claude':
-            from anthropic import Anthropic
-
             if ANTHROPIC_API_KEY == 'votre-cle-api-claude-ici':
                 print("⚠️  Clé API Claude non configurée - Génération d'une fiche d'exemple")
                 return "# Fiche Résumé - Mode Test\n\nCeci est une fiche d'exemple générée en mode test.\n\n## Note\nConfigurez votre clé API dans config.py pour générer de vraies fiches."
 
             print(f"📡 Appel API Claude ({MODELS['claude']})")
-            client = Anthropic(api_key=ANTHROPIC_API_KEY)
+            client = get_anthropic_client(ANTHROPIC_API_KEY)
             response = client.messages.create(
                 model=MODELS['claude'],
                 max_tokens=4000,
@@ -1523,14 +1566,12 @@ def generer_fiche_via_api(texte):
             return fiche_content
 
         elif API_PROVIDER == 'openai':
-            from openai import OpenAI
-
             if OPENAI_API_KEY == 'votre-cle-api-openai-ici':
                 print("⚠️  Clé API OpenAI non configurée - Génération d'une fiche d'exemple")
                 return "# Fiche Résumé - Mode Test\n\nCeci est une fiche d'exemple générée en mode test.\n\n## Note\nConfigurez votre clé API dans config.py pour générer de vraies fiches."
 
             print(f"📡 Appel API OpenAI ({MODELS['openai']})")
-            client = OpenAI(api_key=OPENAI_API_KEY)
+            client = get_openai_client(OPENAI_API_KEY)
             response = client.chat.completions.create(
                 model=MODELS['openai'],
                 messages=[{
@@ -35,3 +35,11 @@ MODELS = {
     'gemini': 'gemini-1.5-flash',  # Gratuit jusqu'à un certain quota
     'openai': 'gpt-4o-mini'  # Version économique d'OpenAI
 }
+
+# === SÉCURITÉ ===
+# Méthode de hachage des mots de passe (voir werkzeug.security.generate_password_hash)
+# En production, gardez une KDF coûteuse. En développement/test, une méthode plus
+# légère accélère l'inscription et la création des comptes de test.
+# Les anciens hashs restent valides : check_password_hash détecte la méthode utilisée.
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'  # Production
+# PASSWORD_HASH_METHOD = 'pbkdf2:sha256:50000'  # Développement
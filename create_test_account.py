@@ -13,6 +13,8 @@ TEST_USERNAME = "test_user"
 TEST_PASSWORD = "test123"
 TEST_SECURITY_QUESTION = "Quelle est votre ville préférée ?"
 TEST_SECURITY_ANSWER = "Paris"
+# KDF légère : ce compte ne sert qu'au développement
+TEST_PASSWORD_HASH_METHOD = "pbkdf2:sha256:50000"
 
 # Données de test pour les flashcards
 SAMPLE_DECKS = [
@@ -89,17 +91,23 @@ def create_test_account():
     db_path = '/home/user/TDLOG_project/flashcards.db'
     conn = sqlite3.connect(db_path)
     conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
     cursor = conn.cursor()
 
     try:
+        # Tout le compte est créé dans une seule transaction
+        cursor.execute('BEGIN')
+
         # 1. Supprimer l'utilisateur test s'il existe déjà
         print("🗑️  Suppression de l'ancien compte test s'il existe...")
         cursor.execute("DELETE FROM users WHERE username = ?", (TEST_USERNAME,))
 
         # 2. Créer l'utilisateur
         print(f"👤 Création de l'utilisateur '{TEST_USERNAME}'...")
-        password_hash = generate_password_hash(TEST_PASSWORD)
-        security_answer_hash = generate_password_hash(TEST_SECURITY_ANSWER.lower())
+        password_hash = generate_password_hash(TEST_PASSWORD, method=TEST_PASSWORD_HASH_METHOD)
+        security_answer_hash = generate_password_hash(TEST_SECURITY_ANSWER.lower(),
+                                                      method=TEST_PASSWORD_HASH_METHOD)
 
         cursor.execute("""
             INSERT INTO users (username, password_hash, security_question, security_answer_hash,
@@ -113,34 +121,44 @@ def create_test_account():
 
         # 3. Créer les decks et flashcards
         print("\n📚 Création des decks et flashcards...")
-        flashcard_ids = []
+        now = datetime.now()
+        flashcard_rows = []
 
         for deck_data in SAMPLE_DECKS:
             # Créer le deck
             cursor.execute("""
                 INSERT INTO decks (name, user_id, created_at)
                 VALUES (?, ?, ?)
-            """, (deck_data["name"], user_id, datetime.now()))
+            """, (deck_data["name"], user_id, now))
 
             deck_id = cursor.lastrowid
             print(f"  📖 Deck '{deck_data['name']}' créé")
 
-            # Créer les flashcards
-            for card in deck_data["flashcards"]:
-                cursor.execute("""
-                    INSERT INTO flashcards (deck_id, question, answer, created_at)
-                    VALUES (?, ?, ?, ?)
-                """, (deck_id, card["question"], card["answer"], datetime.now()))
+            flashcard_rows.extend(
+                (deck_id, card["question"], card["answer"], now)
+                for card in deck_data["flashcards"]
+            )
+            print(f"    ✅ {len(deck_data['flashcards'])} flashcards créées")
 
-                flashcard_ids.append(cursor.lastrowid)
+        # Insérer toutes les flashcards en une seule fois
+        cursor.executemany("""
+            INSERT INTO flashcards (deck_id, question, answer, created_at)
+            VALUES (?, ?, ?, ?)
+        """, flashcard_rows)
 
-            print(f"    ✅ {len(deck_data['flashcards'])} flashcards créées")
+        # Récupérer les IDs dans l'ordre d'insertion
+        cursor.execute("""
+            SELECT f.id FROM flashcards f
+            INNER JOIN decks d ON f.deck_id = d.id
+            WHERE d.user_id = ?
+            ORDER BY f.id
+        """, (user_id,))
+        flashcard_ids = [row[0] for row in cursor.fetchall()]
 
         print(f"\n📊 Total: {len(flashcard_ids)} flashcards créées")
 
         # 4. Simuler des révisions avec l'algorithme Anki
         print("\n🔄 Simulation des révisions...")
-        now = datetime.now()
 
         # Catégoriser les cartes pour une progression réaliste
         num_cards = len(flashcard_ids)
@@ -154,79 +172,71 @@ def create_test_account():
         # 30% de cartes nouvelles ou difficiles
         new_cards = flashcard_ids[int(num_cards * 0.7):]
 
+        progress_rows = []
+
         # Cartes matures : bon intervalle, bonnes stats
         for card_id in mature_cards:
-            ease_factor = random.uniform(2.3, 2.8)
             interval = random.randint(7, 30)
-            repetitions = random.randint(5, 15)
             last_reviewed = now - timedelta(days=random.randint(0, 5))
-            due_date = last_reviewed + timedelta(days=interval)
-
-            cursor.execute("""
-                INSERT INTO user_progress
-                (user_id, flashcard_id, ease_factor, interval, due_date,
-                 step, is_learning, repetitions, last_reviewed)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, card_id, ease_factor, interval, due_date,
-                  0, 0, repetitions, last_reviewed))
+            progress_rows.append((
+                user_id, card_id, random.uniform(2.3, 2.8), interval,
+                last_reviewed + timedelta(days=interval),
+                0, 0, random.randint(5, 15), last_reviewed
+            ))
 
         # Cartes en apprentissage : interval court-moyen
         for card_id in learning_cards:
-            ease_factor = 2.5
             interval = random.randint(1, 6)
             repetitions = random.randint(2, 5)
             is_learning = random.choice([0, 1])
             last_reviewed = now - timedelta(days=random.randint(0, 2))
-            due_date = last_reviewed + timedelta(days=interval)
-
-            cursor.execute("""
-                INSERT INTO user_progress
-                (user_id, flashcard_id, ease_factor, interval, due_date,
-                 step, is_learning, repetitions, last_reviewed)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, card_id, ease_factor, interval, due_date,
-                  random.randint(0, 1), is_learning, repetitions, last_reviewed))
-
-        # Nouvelles cartes : jamais vues ou juste commencées
-        for card_id in new_cards[:len(new_cards)//2]:
-            # La moitié sont complètement nouvelles (pas d'entrée dans user_progress)
-            pass
-
+            progress_rows.append((
+                user_id, card_id, 2.5, interval,
+                last_reviewed + timedelta(days=interval),
+                random.randint(0, 1), is_learning, repetitions, last_reviewed
+            ))
+
+        # Nouvelles cartes : la moitié est complètement nouvelle (pas d'entrée
+        # dans user_progress), l'autre moitié vient d'être commencée
         for card_id in new_cards[len(new_cards)//2:]:
-            # L'autre moitié vient d'être commencée
-            ease_factor = 2.5
-            interval = 0
             last_reviewed = now - timedelta(minutes=random.randint(1, 60))
-            due_date = now + timedelta(minutes=1)
-
-            cursor.execute("""
-                INSERT INTO user_progress
-                (user_id, flashcard_id, ease_factor, interval, due_date,
-                 step, is_learning, repetitions, last_reviewed)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, card_id, ease_factor, interval, due_date,
-                  random.randint(0, 1), 1, random.randint(0, 2), last_reviewed))
+            progress_rows.append((
+                user_id, card_id, 2.5, 0, now + timedelta(minutes=1),
+                random.randint(0, 1), 1, random.randint(0, 2), last_reviewed
+            ))
+
+        cursor.executemany("""
+            INSERT INTO user_progress
+            (user_id, flashcard_id, ease_factor, interval, due_date,
+             step, is_learning, repetitions, last_reviewed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, progress_rows)
+
+        # Échéances en secondes Unix, utilisées par les requêtes de statistiques
+        cursor.execute("""
+            UPDATE user_progress
+            SET due_epoch = CAST(strftime('%s', due_date, 'utc') AS INTEGER)
+            WHERE user_id = ? AND due_date IS NOT NULL
+        """, (user_id,))
 
         print(f"  ✅ Progression créée pour {len(mature_cards) + len(learning_cards) + len(new_cards)//2} cartes")
 
         # 5. Créer l'activité quotidienne pour le streak
         print("\n🔥 Création de l'historique de streak (15 jours)...")
+        activity_rows = []
         for i in range(15, 0, -1):
-            date = (datetime.now() - timedelta(days=i)).date()
             cards_reviewed = random.randint(10, 30)
-
-            cursor.execute("""
-                INSERT INTO daily_activity
-                (user_id, date, cards_reviewed, cards_due_completed, all_cards_completed)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, date, cards_reviewed, cards_reviewed, 0))
-
+            activity_rows.append(
+                (user_id, (now - timedelta(days=i)).date(), cards_reviewed, cards_reviewed, 0)
+            )
         # Ajouter l'activité d'aujourd'hui
-        cursor.execute("""
+        activity_rows.append((user_id, now.date(), 25, 25, 0))
+
+        cursor.executemany("""
             INSERT INTO daily_activity
             (user_id, date, cards_reviewed, cards_due_completed, all_cards_completed)
             VALUES (?, ?, ?, ?, ?)
-        """, (user_id, datetime.now().date(), 25, 25, 0))
+        """, activity_rows)
 
         print("  ✅ Streak de 15 jours créé")
 
@@ -1,19 +1,169 @@
+import atexit
+import logging
 import sqlite3
 import os
+import queue
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict, namedtuple
 from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from functools import wraps
 
 
+logger = logging.getLogger(__name__)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'flashcards.db')
 
+# INSERT ... RETURNING est disponible à partir de SQLite 3.35
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Nombre maximum de connexions inactives conservées par pool : SQLite
+# sérialise les écritures, les lectures peuvent être plus nombreuses
+POOL_SIZE = 4
+READ_POOL_SIZE = 8
+
+# Les connexions du pool restent ouvertes longtemps : PRAGMA optimize est
+# aussi relancé périodiquement (en secondes) après une écriture
+OPTIMIZE_INTERVAL = 3 * 3600
+_last_optimize = time.monotonic()
+
 # Variable globale pour permettre de changer la DB (utilisé pour les tests)
 _current_db_path = DB_PATH
 
 
+def _close_connection(conn):
+    """Ferme une connexion après avoir rafraîchi les statistiques du planificateur"""
+    try:
+        conn.execute('PRAGMA optimize')
+    except sqlite3.Error:
+        pass
+    conn.close()
+
+
+class _PooledConnection(sqlite3.Connection):
+    """Connexion du pool, avec des actions à lancer après le prochain commit"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Rempli par les fonctions d'écriture (invalidation de caches),
+        # vidé par get_db_connection au commit ou au rollback
+        self.after_commit = []
+
+
+class _ConnectionPool:
+    """Pool de connexions SQLite réutilisées d'un appel à l'autre
+
+    Garder les connexions ouvertes évite de rouvrir le fichier et de
+    réappliquer les PRAGMAs à chaque requête, et conserve le cache de
+    pages de chaque connexion.
+    """
+
+    def __init__(self, path, size=POOL_SIZE, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        """Ouvre et configure une nouvelle connexion (une seule fois)"""
+        if self.readonly:
+            # Ouverture en lecture seule via une URI (mode=ro)
+            target = 'file:' + urllib.parse.quote(os.path.abspath(self.path)) + '?mode=ro'
+        else:
+            target = self.path
+        # Cache de requêtes préparées plus large que celui par défaut (128).
+        # isolation_level=None : pas de BEGIN implicite (DEFERRED) avant les
+        # écritures, get_db_connection ouvre lui-même les transactions
+        conn = sqlite3.connect(target, uri=self.readonly, check_same_thread=False,
+                               cached_statements=256, isolation_level=None,
+                               factory=_PooledConnection)
+        # Activer les contraintes de clés étrangères (nécessaire pour CASCADE)
+        conn.execute('PRAGMA foreign_keys = ON')
+        # En mode WAL, NORMAL reste sûr et évite un fsync à chaque commit
+        conn.execute('PRAGMA synchronous = NORMAL')
+        # Tables temporaires (tris, DISTINCT...) en mémoire, cache de 64 Mo
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA cache_size = -64000')
+        conn.execute('PRAGMA mmap_size = 268435456')
+        # Attendre jusqu'à 5 s qu'un autre écrivain libère le verrou
+        # plutôt que d'échouer tout de suite avec "database is locked"
+        conn.execute('PRAGMA busy_timeout = 5000')
+        return conn
+
+    def acquire(self):
+        """Récupère une connexion inactive, ou en ouvre une nouvelle"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        """Remet une connexion dans le pool (ou la ferme si le pool est plein)"""
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            _close_connection(conn)
+
+    def close(self):
+        """Ferme toutes les connexions inactives"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            _close_connection(conn)
+
+
+# Pools de la base courante : lecture/écriture (False) et lecture seule (True)
+_pools = {}
+_pools_path = None
+_pool_lock = threading.Lock()
+
+
+def _close_pools():
+    """Ferme les pools ; appelé avec _pool_lock"""
+    # Lecture seule d'abord : la dernière connexion fermée doit pouvoir
+    # faire le checkpoint du WAL et supprimer les fichiers -wal/-shm
+    for readonly in (True, False):
+        pool = _pools.pop(readonly, None)
+        if pool is not None:
+            pool.close()
+
+
+def _get_pool(readonly=False):
+    """Retourne le pool associé à la base de données courante"""
+    global _pools_path
+    with _pool_lock:
+        if _pools_path != _current_db_path:
+            _close_pools()
+            _pools_path = _current_db_path
+        if readonly not in _pools:
+            size = READ_POOL_SIZE if readonly else POOL_SIZE
+            _pools[readonly] = _ConnectionPool(_current_db_path, size, readonly)
+        return _pools[readonly]
+
+
+def close_db_connections():
+    """Ferme les connexions des pools (changement de base, arrêt de l'application)"""
+    with _pool_lock:
+        _close_pools()
+
+
+atexit.register(close_db_connections)
+
+
 def set_database_path(path):
     """Change le chemin de la base de données (utilisé pour les tests)"""
     global _current_db_path
+    close_db_connections()
     _current_db_path = path
+    get_flashcard_by_id.cache_clear()
+    get_deck_by_name.cache_clear()
+    get_user_streak.cache_clear()
+    get_show_in_leaderboard.cache_clear()
+    _invalidate_leaderboard()
 
 
 def get_database_path():
@@ -21,160 +171,446 @@ def get_database_path():
     return _current_db_path
 
 
+# Durée de vie (en secondes) des lignes mises en cache par _cached_lookup :
+# une suppression faite par un autre processus n'est vue qu'après ce délai
+LOOKUP_CACHE_TTL = 10
+
+
+def _cached_lookup(maxsize):
+    """Met en cache (LRU) les lignes trouvées par une fonction de lecture
+
+    Les absences (None) ne sont pas mises en cache : la ligne peut être créée
+    plus tard. Une ligne reste valable LOOKUP_CACHE_TTL secondes, le temps
+    pour les écritures des autres processus d'être vues. Les fonctions qui
+    modifient les données appellent cache_clear().
+    """
+    def decorator(fetch):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(fetch)
+        def wrapper(*args):
+            now = time.monotonic()
+            with lock:
+                entry = cache.get(args)
+                if entry is not None and now - entry[0] < LOOKUP_CACHE_TTL:
+                    cache.move_to_end(args)
+                    return entry[1]
+            row = fetch(*args)
+            with lock:
+                if row is None:
+                    cache.pop(args, None)
+                else:
+                    cache[args] = (now, row)
+                    cache.move_to_end(args)
+                    if len(cache) > maxsize:
+                        cache.popitem(last=False)
+            return row
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+
+# Durée de vie (en secondes) des valeurs mises en cache par utilisateur : les
+# écritures d'un autre processus ne sont vues qu'après ce délai
+USER_CACHE_TTL = 60
+
+
+def _cached_per_user(fetch):
+    """Met en cache la valeur d'une fonction fetch(user_id)
+
+    Une valeur reste valable USER_CACHE_TTL secondes, et pas au-delà de la
+    journée (un streak non prolongé est cassé le lendemain). Les fonctions qui
+    modifient la donnée appellent invalidate(user_id) une fois leur écriture
+    validée (conn.after_commit dans une transaction).
+    """
+    cache = {}
+
+    @wraps(fetch)
+    def wrapper(user_id):
+        today = date.today()
+        entry = cache.get(user_id)
+        if entry is not None and entry[0] == today and time.monotonic() - entry[1] < USER_CACHE_TTL:
+            return entry[2]
+        value = fetch(user_id)
+        cache[user_id] = (today, time.monotonic(), value)
+        return value
+
+    wrapper.invalidate = lambda user_id: cache.pop(user_id, None)
+    wrapper.cache_clear = cache.clear
+    return wrapper
+
+
+def _maybe_optimize(conn):
+    """Lance PRAGMA optimize au plus une fois par OPTIMIZE_INTERVAL"""
+    global _last_optimize
+    now = time.monotonic()
+    if now - _last_optimize < OPTIMIZE_INTERVAL:
+        return
+    _last_optimize = now
+    try:
+        conn.execute('PRAGMA optimize')
+    except sqlite3.Error:
+        pass
+
+
 @contextmanager
-def get_db_connection():
-    """Context manager pour gérer les connexions à la base de données"""
-    conn = sqlite3.connect(_current_db_path)
-    conn.row_factory = sqlite3.Row  # Pour accéder aux colonnes par nom
-    # Activer les contraintes de clés étrangères (nécessaire pour CASCADE)
-    conn.execute('PRAGMA foreign_keys = ON')
+def get_db_connection(readonly=False, row_factory=sqlite3.Row):
+    """Context manager pour gérer les connexions à la base de données
+
+    Avec readonly=True, la connexion provient d'un pool ouvert en lecture
+    seule : à réserver aux fonctions qui ne font que des SELECT.
+    Sinon, la transaction commence par BEGIN IMMEDIATE : le verrou d'écriture
+    est pris dès l'entrée, ce qui évite l'échec (SQLITE_BUSY) d'une transaction
+    DEFERRED qui lit puis tente d'écrire pendant qu'un autre écrivain est actif.
+    Les lignes sont des sqlite3.Row (accès par nom) ; row_factory=None donne
+    des tuples, plus légers, pour les fonctions qui n'utilisent que row[0].
+    """
+    pool = _get_pool(readonly)
+    conn = pool.acquire()
+    # Réappliqué à chaque emprunt : une connexion du pool peut avoir servi
+    # avec une autre fabrique de lignes
+    conn.row_factory = row_factory
     try:
+        if not readonly:
+            conn.execute('BEGIN IMMEDIATE')
         yield conn
-        conn.commit()
+        if not readonly:
+            conn.commit()
+            # Les caches ne sont invalidés qu'une fois les données validées :
+            # avant, un lecteur concurrent remettrait en cache l'ancienne valeur
+            callbacks, conn.after_commit = conn.after_commit, []
+            for callback in callbacks:
+                callback()
+            _maybe_optimize(conn)
     except Exception:
+        conn.after_commit = []
         conn.rollback()
         raise
     finally:
-        conn.close()
+        # Interruption hors Exception (KeyboardInterrupt, GeneratorExit...) :
+        # une connexion rendue au pool avec BEGIN IMMEDIATE ouvert garderait
+        # le verrou d'écriture
+        if conn.in_transaction:
+            conn.after_commit = []
+            conn.rollback()
+        pool.release(conn)
 
 
-def init_database():
-    """Initialise la base de données avec les tables nécessaires"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        # Table des utilisateurs
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Table des decks de flashcards
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS decks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                user_id INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        ''')
-
-        # Table des flashcards
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS flashcards (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                deck_id INTEGER NOT NULL,
-                question TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE,
-                UNIQUE(deck_id, question)
-            )
-        ''')
-
-        # Table de progression des utilisateurs
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_progress (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                flashcard_id INTEGER NOT NULL,
-                score INTEGER DEFAULT 0,
-                
-                -- Colonnes pour l'algorithme Anki (SRS)
-                ease_factor REAL DEFAULT 2.5,
-                interval INTEGER DEFAULT 0,
-                due_date TEXT,
-                step INTEGER DEFAULT 0,
-                is_learning INTEGER DEFAULT 0,
-                repetitions INTEGER DEFAULT 0,
-                
-                last_reviewed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY (flashcard_id) REFERENCES flashcards(id) ON DELETE CASCADE,
-                UNIQUE(user_id, flashcard_id)
-            )
-        ''')
-
-        # Table des prompts personnalisés par utilisateur
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_prompts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL UNIQUE,
-                custom_prompt TEXT NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        ''')
-
-        # Table des dossiers pour organiser les decks
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS folders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                parent_id INTEGER,
-                user_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (parent_id) REFERENCES folders(id) ON DELETE CASCADE,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        ''')
-
-        # Table d'historique quotidien pour les streaks
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS daily_activity (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                date DATE NOT NULL,
-                cards_reviewed INTEGER DEFAULT 0,
-                cards_due_completed INTEGER DEFAULT 0,
-                all_cards_completed INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-                UNIQUE(user_id, date)
-            )
-        ''')
+@contextmanager
+def transaction():
+    """Regroupe plusieurs écritures dans une seule transaction (un seul commit)
 
-        # Index pour améliorer les performances
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_flashcards_deck
-            ON flashcards(deck_id)
-        ''')
+    Les fonctions qui acceptent un paramètre conn l'utilisent au lieu
+    d'emprunter leur propre connexion :
 
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_progress_user
-            ON user_progress(user_id)
-        ''')
+        with transaction() as conn:
+            update_progress(..., conn=conn)
+            update_daily_activity(..., conn=conn)
 
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_progress_flashcard
-            ON user_progress(flashcard_id)
-        ''')
+    Comme toute connexion en écriture, elle commence par BEGIN IMMEDIATE :
+    les lectures faites dans la transaction restent valables jusqu'au commit.
+    """
+    with get_db_connection() as conn:
+        yield conn
 
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_folders_user
-            ON folders(user_id)
-        ''')
 
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_folders_parent
-            ON folders(parent_id)
-        ''')
+@contextmanager
+def _connection(conn=None, readonly=False, row_factory=sqlite3.Row):
+    """Utilise la connexion d'une transaction en cours, ou en emprunte une au pool"""
+    if conn is not None:
+        yield conn
+    else:
+        with get_db_connection(readonly, row_factory) as conn:
+            yield conn
+
+
+# Version du schéma, stockée dans PRAGMA user_version : init_database ne
+# rejoue le DDL que lorsqu'elle augmente
+SCHEMA_VERSION = 1
+
+_SCHEMA_SQL = '''
+-- Table des utilisateurs
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    security_question TEXT,
+    security_answer_hash TEXT,
+    streak_count INTEGER DEFAULT 0,
+    last_streak_date DATE,
+    show_in_leaderboard INTEGER DEFAULT 1,
+    total_cards INTEGER DEFAULT 0,  -- somme de daily_activity.cards_reviewed
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Table des decks de flashcards
+CREATE TABLE IF NOT EXISTS decks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    user_id INTEGER,
+    folder_id INTEGER REFERENCES folders(id) ON DELETE SET NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Table des flashcards
+CREATE TABLE IF NOT EXISTS flashcards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    deck_id INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE,
+    UNIQUE(deck_id, question)
+);
+
+-- Table de progression des utilisateurs
+CREATE TABLE IF NOT EXISTS user_progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    flashcard_id INTEGER NOT NULL,
+    score INTEGER DEFAULT 0,
+
+    -- Colonnes pour l'algorithme Anki (SRS)
+    ease_factor REAL DEFAULT 2.5,
+    interval INTEGER DEFAULT 0,
+    due_date TEXT,
+    due_epoch INTEGER,  -- due_date en secondes Unix (UTC), pour les comparaisons
+    step INTEGER DEFAULT 0,
+    is_learning INTEGER DEFAULT 0,
+    repetitions INTEGER DEFAULT 0,
+
+    last_reviewed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (flashcard_id) REFERENCES flashcards(id) ON DELETE CASCADE,
+    UNIQUE(user_id, flashcard_id)
+);
+
+-- Table des prompts personnalisés par utilisateur
+CREATE TABLE IF NOT EXISTS user_prompts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL UNIQUE,
+    custom_prompt TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Table des dossiers pour organiser les decks
+CREATE TABLE IF NOT EXISTS folders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    parent_id INTEGER,
+    user_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (parent_id) REFERENCES folders(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Table d'historique quotidien pour les streaks
+CREATE TABLE IF NOT EXISTS daily_activity (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    date DATE NOT NULL,
+    cards_reviewed INTEGER DEFAULT 0,
+    cards_due_completed INTEGER DEFAULT 0,
+    all_cards_completed INTEGER DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    UNIQUE(user_id, date)
+);
+
+-- Classement précalculé (100 premiers), recalculé par refresh_leaderboard
+CREATE TABLE IF NOT EXISTS leaderboard_cache (
+    rank INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    streak_count INTEGER,
+    total_cards INTEGER,
+    score INTEGER,
+    refreshed_at INTEGER NOT NULL,  -- secondes Unix
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Index pour améliorer les performances
+CREATE INDEX IF NOT EXISTS idx_flashcards_deck ON flashcards(deck_id);
+-- Les recherches par (user_id, flashcard_id) et par user_id seul passent par
+-- l'index de la contrainte UNIQUE(user_id, flashcard_id)
+DROP INDEX IF EXISTS idx_progress_user;
+CREATE INDEX IF NOT EXISTS idx_progress_flashcard ON user_progress(flashcard_id);
+-- Compteurs et statistiques : la progression de chaque carte est lue par
+-- (user_id, flashcard_id), et is_learning/due_epoch depuis l'index seul
+CREATE INDEX IF NOT EXISTS idx_progress_user_card_due
+ON user_progress(user_id, flashcard_id, is_learning, due_epoch);
+-- Activité des 30 derniers jours (statistiques)
+CREATE INDEX IF NOT EXISTS idx_progress_last_reviewed ON user_progress(user_id, last_reviewed);
+CREATE INDEX IF NOT EXISTS idx_decks_user_folder ON decks(user_id, folder_id);
+CREATE INDEX IF NOT EXISTS idx_folders_user ON folders(user_id);
+CREATE INDEX IF NOT EXISTS idx_folders_parent ON folders(parent_id);
+CREATE INDEX IF NOT EXISTS idx_daily_activity_user ON daily_activity(user_id);
+CREATE INDEX IF NOT EXISTS idx_daily_activity_date ON daily_activity(date);
+-- Utilisateurs visibles dans le classement, déjà triés par score : le
+-- recalcul lit les 100 premières entrées de l'index, sans tri
+CREATE INDEX IF NOT EXISTS idx_users_leaderboard_score
+ON users(COALESCE(total_cards, 0) * COALESCE(streak_count, 0) DESC, streak_count DESC)
+WHERE show_in_leaderboard = 1;
+
+-- Streak tenu à jour par SQLite dès qu'une journée est marquée terminée :
+-- +1 si la dernière date est la veille, inchangé si c'est le même jour,
+-- sinon on recommence à 1. L'UPSERT de update_daily_activity déclenche
+-- l'un ou l'autre trigger selon que la ligne du jour existe déjà.
+CREATE TRIGGER IF NOT EXISTS trg_streak_on_insert
+AFTER INSERT ON daily_activity
+WHEN NEW.all_cards_completed
+BEGIN
+    UPDATE users SET
+        streak_count = CASE last_streak_date
+            WHEN date(NEW.date, '-1 day') THEN COALESCE(streak_count, 0) + 1
+            WHEN NEW.date THEN COALESCE(streak_count, 0)
+            ELSE 1
+        END,
+        last_streak_date = NEW.date
+    WHERE id = NEW.user_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_streak_on_update
+AFTER UPDATE OF all_cards_completed ON daily_activity
+WHEN NEW.all_cards_completed
+BEGIN
+    UPDATE users SET
+        streak_count = CASE last_streak_date
+            WHEN date(NEW.date, '-1 day') THEN COALESCE(streak_count, 0) + 1
+            WHEN NEW.date THEN COALESCE(streak_count, 0)
+            ELSE 1
+        END,
+        last_streak_date = NEW.date
+    WHERE id = NEW.user_id;
+END;
+
+-- Total de cartes révisées tenu à jour à chaque écriture de l'activité
+-- (les lignes ne sont supprimées qu'avec l'utilisateur, par cascade)
+CREATE TRIGGER IF NOT EXISTS trg_total_cards_on_insert
+AFTER INSERT ON daily_activity
+BEGIN
+    UPDATE users SET total_cards = COALESCE(total_cards, 0) + COALESCE(NEW.cards_reviewed, 0)
+    WHERE id = NEW.user_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_total_cards_on_update
+AFTER UPDATE OF cards_reviewed ON daily_activity
+BEGIN
+    UPDATE users SET total_cards = COALESCE(total_cards, 0)
+        + COALESCE(NEW.cards_reviewed, 0) - COALESCE(OLD.cards_reviewed, 0)
+    WHERE id = NEW.user_id;
+END;
+'''
+
+# Colonnes ajoutées après la création des premières bases :
+# (table, colonne, définition, requête de remplissage éventuelle)
+_COLUMN_MIGRATIONS = [
+    ('users', 'security_question', 'TEXT', None),
+    ('users', 'security_answer_hash', 'TEXT', None),
+    ('users', 'streak_count', 'INTEGER DEFAULT 0', None),
+    ('users', 'last_streak_date', 'DATE', None),
+    ('users', 'show_in_leaderboard', 'INTEGER DEFAULT 1', None),
+    ('users', 'total_cards', 'INTEGER DEFAULT 0',
+     # Total repris de l'historique, ensuite tenu à jour par les triggers
+     "UPDATE users SET total_cards = (SELECT COALESCE(SUM(cards_reviewed), 0) "
+     "FROM daily_activity WHERE daily_activity.user_id = users.id)"),
+    ('decks', 'folder_id', 'INTEGER REFERENCES folders(id) ON DELETE SET NULL', None),
+    ('user_progress', 'due_epoch', 'INTEGER',
+     # Échéance en entier, calculée depuis due_date (heure locale)
+     "UPDATE user_progress SET due_epoch = CAST(strftime('%s', due_date, 'utc') AS INTEGER) "
+     "WHERE due_date IS NOT NULL"),
+]
+
+
+def _table_columns(conn, table_name):
+    """Retourne l'ensemble des colonnes d'une table (vide si elle n'existe pas)"""
+    return {row['name'] for row in conn.execute(f'PRAGMA table_info({table_name})')}
+
+
+def _table_exists(conn, table_name):
+    """Vérifie si une table existe"""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+    ).fetchone() is not None
+
+
+def _migration_sql(conn):
+    """Retourne le SQL qui ajoute les colonnes manquantes aux tables existantes
+
+    Renvoie (ajouts de colonnes, remplissages) : les ALTER TABLE passent avant
+    le schéma (ses index utilisent les nouvelles colonnes), les remplissages
+    après, une fois créées les tables qu'ils lisent (daily_activity...).
+    """
+    alters, backfills = [], []
+    # Un seul PRAGMA table_info par table, quel que soit le nombre de colonnes
+    columns = {table: _table_columns(conn, table) for table, *_ in _COLUMN_MIGRATIONS}
+    for table, column, definition, backfill in _COLUMN_MIGRATIONS:
+        if columns[table] and column not in columns[table]:
+            alters.append(f'ALTER TABLE {table} ADD COLUMN {column} {definition};')
+            if backfill:
+                backfills.append(backfill + ';')
+    return '\n'.join(alters), '\n'.join(backfills)
+
+
+def _script_statements(script):
+    """Découpe un script SQL en instructions complètes (corps de triggers compris)"""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
 
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_daily_activity_user
-            ON daily_activity(user_id)
-        ''')
 
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_daily_activity_date
-            ON daily_activity(date)
-        ''')
+def init_database():
+    """Initialise la base de données avec les tables nécessaires"""
+    with get_db_connection() as conn:
+        # journal_mode ne peut pas changer dans une transaction : on valide
+        # celle (vide) ouverte par get_db_connection, le script ci-dessous
+        # gère la sienne
+        conn.commit()
 
-        print("✅ Base de données initialisée avec succès")
+        # Réglages persistants, stockés dans le fichier : la taille de page doit
+        # être fixée avant la création des tables, puis passage en journal WAL
+        # (les lectures ne bloquent plus les écritures et inversement)
+        conn.execute('PRAGMA page_size = 4096')
+        conn.execute('PRAGMA journal_mode = WAL')
+
+        # Schéma déjà à jour : rien à faire
+        if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            # Verrou d'écriture pris avant de relire la version : si plusieurs
+            # processus démarrent ensemble, un seul applique les migrations,
+            # les autres trouvent ensuite la version à jour.
+            # (executescript validerait d'abord la transaction en cours : les
+            # instructions sont exécutées une par une)
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                    # Migrations des anciennes bases, création des tables et
+                    # index, remplissage des nouvelles colonnes, puis nouvelle
+                    # version : le tout dans une seule transaction
+                    alters, backfills = _migration_sql(conn)
+                    script = (alters + '\n' + _SCHEMA_SQL + backfills + '\n'
+                              + f'PRAGMA user_version = {SCHEMA_VERSION};\n')
+                    for statement in _script_statements(script):
+                        conn.execute(statement)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        # Statistiques du planificateur : ANALYZE complet à la création,
+        # puis PRAGMA optimize (qui ne ré-analyse que si nécessaire)
+        conn.execute('PRAGMA optimize' if _table_exists(conn, 'sqlite_stat1') else 'ANALYZE')
+
+        # Appelée à chaque test : simple message de débogage, sans coût
+        # lorsque la journalisation n'est pas activée
+        logger.debug("Base de données initialisée (%s)", _current_db_path)
 
 
 # --- FONCTIONS POUR LES UTILISATEURS ---
@@ -182,36 +618,35 @@ def init_database():
 def create_user(username, password_hash, security_question=None, security_answer_hash=None):
     """Crée un nouvel utilisateur avec question de sécurité optionnelle"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+        return conn.execute(
             'INSERT INTO users (username, password_hash, security_question, security_answer_hash) VALUES (?, ?, ?, ?)',
             (username, password_hash, security_question, security_answer_hash)
-        )
-        return cursor.lastrowid
+        ).lastrowid
 
 
 def get_user_by_username(username):
     """Récupère un utilisateur par son nom"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-        return cursor.fetchone()
+    with get_db_connection(readonly=True) as conn:
+        return conn.execute('SELECT id, username, password_hash FROM users WHERE username = ?', (username,)).fetchone()
 
 
-def get_all_users():
-    """Récupère tous les utilisateurs"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users')
-        return cursor.fetchall()
+def get_all_users(limit=None, after_id=0):
+    """Récupère les utilisateurs par ordre d'id, par pages de limit après after_id"""
+    with get_db_connection(readonly=True) as conn:
+        # Pagination par clé : parcours de la clé primaire à partir de after_id,
+        # sans OFFSET (LIMIT -1 : pas de limite)
+        return conn.execute(
+            'SELECT id, username, created_at FROM users WHERE id > ? ORDER BY id LIMIT ?',
+            (after_id, -1 if limit is None else limit)
+        ).fetchall()
 
 
 def get_user_security_question(username):
     """Récupère la question de sécurité d'un utilisateur"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT security_question FROM users WHERE username = ?', (username,))
-        result = cursor.fetchone()
+    with get_db_connection(readonly=True) as conn:
+        result = conn.execute(
+            'SELECT security_question FROM users WHERE username = ?', (username,)
+        ).fetchone()
         return result['security_question'] if result else None
 
 
@@ -219,10 +654,10 @@ def verify_security_answer(username, answer):
     """Vérifie la réponse à la question de sécurité"""
     from werkzeug.security import check_password_hash
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT security_answer_hash FROM users WHERE username = ?', (username,))
-        result = cursor.fetchone()
+    with get_db_connection(readonly=True) as conn:
+        result = conn.execute(
+            'SELECT security_answer_hash FROM users WHERE username = ?', (username,)
+        ).fetchone()
         if result and result['security_answer_hash']:
             return check_password_hash(result['security_answer_hash'], answer)
         return False
@@ -231,8 +666,7 @@ def verify_security_answer(username, answer):
 def update_user_password(username, new_password_hash):
     """Met à jour le mot de passe d'un utilisateur"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+        conn.execute(
             'UPDATE users SET password_hash = ? WHERE username = ?',
             (new_password_hash, username)
         )
@@ -241,176 +675,241 @@ def update_user_password(username, new_password_hash):
 # --- FONCTIONS POUR LES DECKS ---
 
 def create_deck(name, user_id=None):
-    """Crée un nouveau deck pour un utilisateur"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute('INSERT INTO decks (name, user_id) VALUES (?, ?)', (name, user_id))
-            return cursor.lastrowid
-        except sqlite3.IntegrityError:
-            # Le deck existe déjà, vérifier s'il appartient à cet utilisateur
-            if user_id:
-                cursor.execute('SELECT id FROM decks WHERE name = ? AND user_id = ?', (name, user_id))
-            else:
-                cursor.execute('SELECT id FROM decks WHERE name = ?', (name,))
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            # Si le deck existe mais appartient à un autre utilisateur, créer un nom unique
-            cursor.execute('INSERT INTO decks (name, user_id) VALUES (?, ?)',
-                         (f"{name}_{user_id}", user_id))
-            return cursor.lastrowid
+    """Crée un nouveau deck pour un utilisateur (ou retourne celui qui existe déjà)"""
+    with get_db_connection(row_factory=None) as conn:
+        # La table decks n'a pas de contrainte d'unicité : chercher d'abord le deck
+        if user_id:
+            row = conn.execute(
+                'SELECT id FROM decks WHERE name = ? AND user_id = ?', (name, user_id)
+            ).fetchone()
+        else:
+            row = conn.execute('SELECT id FROM decks WHERE name = ?', (name,)).fetchone()
+        if row:
+            return row[0]
+
+        get_deck_by_name.cache_clear()
+        if _HAS_RETURNING:
+            return conn.execute(
+                'INSERT INTO decks (name, user_id) VALUES (?, ?) RETURNING id', (name, user_id)
+            ).fetchone()[0]
+        return conn.execute(
+            'INSERT INTO decks (name, user_id) VALUES (?, ?)', (name, user_id)
+        ).lastrowid
 
 
+@_cached_lookup(maxsize=1024)
 def get_deck_by_name(name):
     """Récupère un deck par son nom"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM decks WHERE name = ?', (name,))
-        return cursor.fetchone()
+    with get_db_connection(readonly=True) as conn:
+        return conn.execute('SELECT id, name, user_id, folder_id FROM decks WHERE name = ?', (name,)).fetchone()
 
 
 def get_all_decks():
     """Récupère tous les decks"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM decks ORDER BY name')
-        return cursor.fetchall()
+    with get_db_connection(readonly=True) as conn:
+        return conn.execute('SELECT id, name, user_id, folder_id FROM decks ORDER BY name').fetchall()
 
 
 def get_user_decks(user_id):
     """Récupère tous les decks d'un utilisateur"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM decks WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
-        return cursor.fetchall()
+    with get_db_connection(readonly=True) as conn:
+        return conn.execute(
+            'SELECT id, name, user_id, folder_id FROM decks WHERE user_id = ? ORDER BY created_at DESC', (user_id,)
+        ).fetchall()
 
 
 def delete_deck(deck_id):
     """Supprime un deck et toutes ses flashcards"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM decks WHERE id = ?', (deck_id,))
+        conn.execute('DELETE FROM decks WHERE id = ?', (deck_id,))
+    # Les flashcards du deck sont supprimées en cascade
+    get_deck_by_name.cache_clear()
+    get_flashcard_by_id.cache_clear()
 
 
 # --- FONCTIONS POUR LES FLASHCARDS ---
 
-def create_flashcard(deck_id, question, answer):
-    """Crée une nouvelle flashcard"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
+def create_flashcard(deck_id, question, answer, conn=None):
+    """Crée une nouvelle flashcard (retourne l'ID existant si la question est déjà dans le deck)"""
+    with _connection(conn, row_factory=None) as conn:
+        if _HAS_RETURNING:
+            # L'UPDATE sans effet permet à RETURNING de renvoyer l'ID existant
+            return conn.execute('''
+                INSERT INTO flashcards (deck_id, question, answer) VALUES (?, ?, ?)
+                ON CONFLICT(deck_id, question) DO UPDATE SET question = excluded.question
+                RETURNING id
+            ''', (deck_id, question, answer)).fetchone()[0]
+
         try:
-            cursor.execute(
+            return conn.execute(
                 'INSERT INTO flashcards (deck_id, question, answer) VALUES (?, ?, ?)',
                 (deck_id, question, answer)
-            )
-            return cursor.lastrowid
+            ).lastrowid
         except sqlite3.IntegrityError:
             # La flashcard existe déjà dans ce deck
-            cursor.execute(
+            result = conn.execute(
                 'SELECT id FROM flashcards WHERE deck_id = ? AND question = ?',
                 (deck_id, question)
-            )
-            result = cursor.fetchone()
+            ).fetchone()
             return result[0] if result else None
 
 
+# Taille des lots pour les insertions groupées
+BULK_BATCH_SIZE = 500
+
+
+def create_flashcards_bulk(deck_id, qa_pairs):
+    """Crée plusieurs flashcards en une seule transaction (les doublons sont ignorés)
+
+    Retourne le nombre de flashcards réellement insérées.
+    """
+    rows = [(deck_id, question, answer) for question, answer in qa_pairs]
+    with get_db_connection() as conn:
+        changes_before = conn.total_changes
+        for start in range(0, len(rows), BULK_BATCH_SIZE):
+            conn.executemany(
+                'INSERT OR IGNORE INTO flashcards (deck_id, question, answer) VALUES (?, ?, ?)',
+                rows[start:start + BULK_BATCH_SIZE]
+            )
+        return conn.total_changes - changes_before
+
+
 def get_flashcards_by_deck(deck_id):
     """Récupère toutes les flashcards d'un deck"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT * FROM flashcards WHERE deck_id = ? ORDER BY id',
+    with get_db_connection(readonly=True) as conn:
+        return conn.execute(
+            'SELECT id, deck_id, question, answer FROM flashcards WHERE deck_id = ? ORDER BY id',
             (deck_id,)
-        )
-        return cursor.fetchall()
+        ).fetchall()
 
 
+def iter_flashcards_by_deck(deck_id, batch_size=BULK_BATCH_SIZE):
+    """Parcourt les flashcards d'un deck par lots, sans tout charger en mémoire"""
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.execute(
+            'SELECT id, deck_id, question, answer FROM flashcards WHERE deck_id = ? ORDER BY id',
+            (deck_id,)
+        )
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            # Libérer la requête avant de rendre la connexion au pool,
+            # même si le parcours est interrompu
+            cursor.close()
+
+
+@_cached_lookup(maxsize=4096)
 def get_flashcard_by_id(flashcard_id):
-    """Récupère une flashcard par son ID"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM flashcards WHERE id = ?', (flashcard_id,))
-        return cursor.fetchone()
+    """Récupère une flashcard par son ID (non modifiée après sa création)"""
+    with get_db_connection(readonly=True) as conn:
+        return conn.execute(
+            'SELECT id, deck_id, question, answer FROM flashcards WHERE id = ?', (flashcard_id,)
+        ).fetchone()
 
 
 # --- FONCTIONS POUR LA PROGRESSION ---
 
-def get_user_progress(user_id, flashcard_id):
+def get_user_progress(user_id, flashcard_id, conn=None):
     """Récupère la progression d'un utilisateur pour une flashcard"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    with _connection(conn, readonly=True) as conn:
+        return conn.execute(
             'SELECT * FROM user_progress WHERE user_id = ? AND flashcard_id = ?',
             (user_id, flashcard_id)
-        )
-        return cursor.fetchone()
+        ).fetchone()
+
+
+_SQL_UPDATE_PROGRESS = '''
+    INSERT INTO user_progress
+        (user_id, flashcard_id, ease_factor, interval, due_date, due_epoch,
+         step, is_learning, repetitions, last_reviewed)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id, flashcard_id)
+    DO UPDATE SET
+        ease_factor = excluded.ease_factor,
+        interval = excluded.interval,
+        due_date = excluded.due_date,
+        due_epoch = excluded.due_epoch,
+        step = excluded.step,
+        is_learning = excluded.is_learning,
+        repetitions = excluded.repetitions,
+        last_reviewed = excluded.last_reviewed
+'''
+
+# Nouvelles cartes d'abord, puis par échéance : les NULL sont triés en
+# premier et les cartes dues précèdent les autres, sans CASE par ligne
+_SQL_ALL_PROGRESS = '''
+    SELECT
+        f.id, f.question, f.answer,
+        up.ease_factor, up.interval, up.due_date,
+        up.step, up.is_learning, up.repetitions
+    FROM flashcards f
+    LEFT JOIN user_progress up
+        ON f.id = up.flashcard_id AND up.user_id = ?
+    WHERE f.deck_id = ?
+    ORDER BY up.due_epoch
+'''
+
+
+def _due_epoch(due_date):
+    """Convertit une échéance (ISO, heure locale) en secondes Unix"""
+    if not due_date:
+        return None
+    if isinstance(due_date, str):
+        due_date = datetime.fromisoformat(due_date)
+    return int(due_date.timestamp())
+
+
+def _now_epoch():
+    """Instant présent en secondes Unix, passé en paramètre aux requêtes
+
+    Une seule valeur par appel, partagée par toutes les requêtes d'un même
+    calcul, au lieu d'évaluer strftime('%s', 'now') dans chaque CASE.
+    """
+    return int(time.time())
 
 
 def update_progress(user_id, flashcard_id, ease_factor, interval, due_date,
-                   step, is_learning, repetitions):
+                   step, is_learning, repetitions, conn=None):
     """Met à jour ou crée la progression d'un utilisateur (système Anki)"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO user_progress
-                (user_id, flashcard_id, ease_factor, interval, due_date,
-                 step, is_learning, repetitions, last_reviewed)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ON CONFLICT(user_id, flashcard_id)
-            DO UPDATE SET
-                ease_factor = ?,
-                interval = ?,
-                due_date = ?,
-                step = ?,
-                is_learning = ?,
-                repetitions = ?,
-                last_reviewed = CURRENT_TIMESTAMP
-        ''', (user_id, flashcard_id, ease_factor, interval, due_date,
-              step, is_learning, repetitions,
-              ease_factor, interval, due_date, step, is_learning, repetitions))
+    with _connection(conn) as conn:
+        conn.execute(_SQL_UPDATE_PROGRESS, (user_id, flashcard_id, ease_factor, interval,
+                                            due_date, _due_epoch(due_date),
+                                            step, is_learning, repetitions))
+
+
+# Ligne de get_all_user_progress : accès par attribut (carte.due_date), plus
+# rapide que sqlite3.Row dans la boucle de sélection de piocher_carte
+Progress = namedtuple('Progress', 'id question answer ease_factor interval due_date '
+                                  'step is_learning repetitions')
 
 
 def get_all_user_progress(user_id, deck_id):
     """Récupère toute la progression d'un utilisateur pour un deck (système Anki)"""
-    with get_db_connection() as conn:
+    with get_db_connection(readonly=True) as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT
-                f.id, f.question, f.answer,
-                up.ease_factor, up.interval, up.due_date,
-                up.step, up.is_learning, up.repetitions
-            FROM flashcards f
-            LEFT JOIN user_progress up
-                ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE f.deck_id = ?
-            ORDER BY
-                CASE
-                    WHEN up.due_date IS NULL THEN 0
-                    WHEN up.due_date <= datetime('now') THEN 1
-                    ELSE 2
-                END,
-                up.due_date
-        ''', (user_id, deck_id))
-        return cursor.fetchall()
+        cursor.row_factory = lambda _cursor, row: Progress._make(row)
+        return cursor.execute(_SQL_ALL_PROGRESS, (user_id, deck_id)).fetchall()
 
 
 # --- FONCTIONS POUR LES PROMPTS PERSONNALISÉS ---
 
 def get_user_prompt(user_id):
     """Récupère le prompt personnalisé d'un utilisateur"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT custom_prompt FROM user_prompts WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
+    with get_db_connection(readonly=True) as conn:
+        result = conn.execute(
+            'SELECT custom_prompt FROM user_prompts WHERE user_id = ?', (user_id,)
+        ).fetchone()
         return result['custom_prompt'] if result else None
 
 
 def save_user_prompt(user_id, custom_prompt):
     """Sauvegarde ou met à jour le prompt personnalisé d'un utilisateur"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
+        conn.execute('''
             INSERT INTO user_prompts (user_id, custom_prompt, updated_at)
             VALUES (?, ?, datetime('now'))
             ON CONFLICT(user_id) DO UPDATE SET
@@ -421,112 +920,136 @@ def save_user_prompt(user_id, custom_prompt):
 
 # --- FONCTIONS POUR LES STATISTIQUES ---
 
-def get_user_flashcard_counts(user_id):
+# Compteurs nouvelles/à réapprendre/à réviser, en une seule passe : chaque carte
+# a au plus une ligne de progression par utilisateur (UNIQUE)
+_SQL_COUNTS_COLUMNS = '''
+        COUNT(CASE WHEN up.id IS NULL THEN 1 END) as new_cards,
+        COUNT(CASE WHEN up.is_learning = 1
+                   AND up.due_epoch <= ? THEN 1 END) as relearn_cards,
+        COUNT(CASE WHEN up.is_learning = 0
+                   AND up.due_epoch <= ? THEN 1 END) as review_cards
+'''
+
+_SQL_COUNTS_SELECT = '''
+    SELECT''' + _SQL_COUNTS_COLUMNS
+
+_SQL_USER_COUNTS = _SQL_COUNTS_SELECT + '''
+    FROM flashcards f
+    INNER JOIN decks d ON f.deck_id = d.id
+    LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
+    WHERE d.user_id = ?
+'''
+
+_SQL_FOLDER_COUNTS = _SQL_COUNTS_SELECT + '''
+    FROM flashcards f
+    INNER JOIN decks d ON f.deck_id = d.id
+    LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
+    WHERE d.user_id = ? AND d.folder_id = ?
+'''
+
+_SQL_DECK_COUNTS = _SQL_COUNTS_SELECT + '''
+    FROM flashcards f
+    LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
+    WHERE f.deck_id = ?
+'''
+
+# Compteurs de tous les decks d'un utilisateur en une requête (menu des decks)
+_SQL_USER_DECK_COUNTS = '''
+    SELECT f.deck_id,''' + _SQL_COUNTS_COLUMNS + '''
+    FROM flashcards f
+    INNER JOIN decks d ON f.deck_id = d.id
+    LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
+    WHERE d.user_id = ?
+    GROUP BY f.deck_id
+'''
+
+# user_progress est unique par (user_id, flashcard_id) : une ligne par carte
+# dans la jointure, donc pas besoin de COUNT(DISTINCT ...)
+_SQL_GLOBAL_STATS = '''
+    WITH cards AS (
+        SELECT up.id as progress_id, up.is_learning, up.due_epoch
+        FROM flashcards f
+        INNER JOIN decks d ON f.deck_id = d.id
+        LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
+        WHERE d.user_id = ?
+    )
+    SELECT
+        (SELECT COUNT(*) FROM decks WHERE user_id = ?) as total_decks,
+        COUNT(*) as total_cards,
+        COUNT(progress_id) as cards_studied,
+        COUNT(CASE WHEN is_learning = 1 THEN 1 END) as cards_learning,
+        COUNT(CASE WHEN is_learning = 0 THEN 1 END) as cards_mature,
+        COUNT(CASE WHEN due_epoch <= ? THEN 1 END) as cards_due
+    FROM cards
+'''
+
+_SQL_DECK_STATS = '''
+    SELECT
+        d.name as deck_name,
+        COUNT(f.id) as total,
+        COUNT(up.id) as studied,
+        COUNT(CASE WHEN up.due_epoch <= ? THEN 1 END) as due,
+        COUNT(CASE WHEN up.is_learning = 1 THEN 1 END) as learning,
+        COUNT(CASE WHEN up.is_learning = 0 THEN 1 END) as mature
+    FROM decks d
+    LEFT JOIN flashcards f ON d.id = f.deck_id
+    LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
+    WHERE d.user_id = ?
+    GROUP BY d.id, d.name
+    ORDER BY d.name
+'''
+
+_SQL_ACTIVITY_30D = '''
+    SELECT
+        date(last_reviewed) as date,
+        COUNT(*) as cards_reviewed
+    FROM user_progress
+    WHERE user_id = ?
+    -- Comparaison directe (texte ISO) plutôt que date(last_reviewed) :
+    -- le filtre reste un parcours d'intervalle sur idx_progress_last_reviewed
+    AND last_reviewed >= date('now', '-30 days')
+    GROUP BY date(last_reviewed)
+    ORDER BY date(last_reviewed)
+'''
+
+
+def _counts_dict(row):
+    """Convertit une ligne de compteurs en dictionnaire"""
+    return {
+        'new': row['new_cards'],
+        'relearn': row['relearn_cards'],
+        'review': row['review_cards']
+    }
+
+
+def get_user_flashcard_counts(user_id, conn=None):
     """Récupère les compteurs de cartes nouvelles/à réapprendre/à réviser pour un utilisateur"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        # Cartes nouvelles (jamais étudiées)
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as new_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ? AND up.id IS NULL
-        ''', (user_id, user_id))
-        new_count = cursor.fetchone()['new_cards']
-
-        # Cartes à réapprendre (en apprentissage et dues)
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as relearn_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ?
-            AND up.is_learning = 1
-            AND up.due_date <= datetime('now')
-        ''', (user_id, user_id))
-        relearn_count = cursor.fetchone()['relearn_cards']
-
-        # Cartes à réviser (matures et dues)
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as review_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ?
-            AND up.is_learning = 0
-            AND up.due_date <= datetime('now')
-        ''', (user_id, user_id))
-        review_count = cursor.fetchone()['review_cards']
-
-        return {
-            'new': new_count,
-            'relearn': relearn_count,
-            'review': review_count
-        }
+    with _connection(conn, readonly=True) as conn:
+        now = _now_epoch()
+        return _counts_dict(conn.execute(_SQL_USER_COUNTS, (now, now, user_id, user_id)).fetchone())
 
 
 def get_user_statistics(user_id):
     """Récupère les statistiques complètes d'un utilisateur (style Anki)"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-
+    now = _now_epoch()
+    with get_db_connection(readonly=True) as conn:
         # Statistiques globales
-        cursor.execute('''
-            SELECT
-                COUNT(DISTINCT d.id) as total_decks,
-                COUNT(DISTINCT f.id) as total_cards,
-                COUNT(DISTINCT CASE WHEN up.id IS NOT NULL THEN f.id END) as cards_studied,
-                COUNT(DISTINCT CASE WHEN up.is_learning = 1 THEN f.id END) as cards_learning,
-                COUNT(DISTINCT CASE WHEN up.is_learning = 0 THEN f.id END) as cards_mature,
-                COUNT(DISTINCT CASE WHEN up.due_date <= datetime('now') THEN f.id END) as cards_due
-            FROM decks d
-            LEFT JOIN flashcards f ON d.id = f.deck_id
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ?
-        ''', (user_id, user_id))
-        global_stats = cursor.fetchone()
-
-        # Cartes révisées aujourd'hui
-        cursor.execute('''
-            SELECT COUNT(DISTINCT flashcard_id) as cards_today
-            FROM user_progress
-            WHERE user_id = ?
-            AND date(last_reviewed) = date('now')
-        ''', (user_id,))
-        today_stats = cursor.fetchone()
+        global_stats = conn.execute(_SQL_GLOBAL_STATS, (user_id, user_id, user_id, now)).fetchone()
 
         # Statistiques par deck
-        cursor.execute('''
-            SELECT
-                d.name as deck_name,
-                COUNT(DISTINCT f.id) as total,
-                COUNT(DISTINCT CASE WHEN up.id IS NOT NULL THEN f.id END) as studied,
-                COUNT(DISTINCT CASE WHEN up.due_date <= datetime('now') THEN f.id END) as due,
-                COUNT(DISTINCT CASE WHEN up.is_learning = 1 THEN f.id END) as learning,
-                COUNT(DISTINCT CASE WHEN up.is_learning = 0 THEN f.id END) as mature
-            FROM decks d
-            LEFT JOIN flashcards f ON d.id = f.deck_id
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ?
-            GROUP BY d.id, d.name
-            ORDER BY d.name
-        ''', (user_id, user_id))
-        deck_stats = cursor.fetchall()
+        deck_stats = conn.execute(_SQL_DECK_STATS, (now, user_id, user_id)).fetchall()
 
         # Activité des 30 derniers jours
-        cursor.execute('''
-            SELECT
-                date(last_reviewed) as date,
-                COUNT(DISTINCT flashcard_id) as cards_reviewed
-            FROM user_progress
-            WHERE user_id = ?
-            AND date(last_reviewed) >= date('now', '-30 days')
-            GROUP BY date(last_reviewed)
-            ORDER BY date(last_reviewed)
-        ''', (user_id,))
-        activity_stats = cursor.fetchall()
+        activity_stats = conn.execute(_SQL_ACTIVITY_30D, (user_id,)).fetchall()
+
+        # Cartes révisées aujourd'hui, extraites de l'activité ci-dessus
+        # (date('now') de SQLite est en UTC)
+        today = datetime.now(timezone.utc).date().isoformat()
+        today_stats = {
+            'cards_today': next(
+                (row['cards_reviewed'] for row in activity_stats if row['date'] == today), 0
+            )
+        }
 
         return {
             'global': global_stats,
@@ -541,28 +1064,27 @@ def get_user_statistics(user_id):
 def create_folder(user_id, name, parent_id=None):
     """Crée un nouveau dossier pour organiser les decks"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+        return conn.execute(
             'INSERT INTO folders (user_id, name, parent_id) VALUES (?, ?, ?)',
             (user_id, name, parent_id)
-        )
-        return cursor.lastrowid
+        ).lastrowid
 
 
 def get_user_folders(user_id, parent_id=None):
     """Récupère les dossiers d'un utilisateur (optionnellement filtrés par parent)"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
+    with get_db_connection(readonly=True) as conn:
         if parent_id is None:
             # Récupérer les dossiers racine (sans parent)
-            cursor.execute(
-                'SELECT * FROM folders WHERE user_id = ? AND parent_id IS NULL ORDER BY name',
+            cursor = conn.execute(
+                'SELECT id, name, parent_id, user_id FROM folders '
+                'WHERE user_id = ? AND parent_id IS NULL ORDER BY name',
                 (user_id,)
             )
         else:
             # Récupérer les sous-dossiers d'un dossier parent
-            cursor.execute(
-                'SELECT * FROM folders WHERE user_id = ? AND parent_id = ? ORDER BY name',
+            cursor = conn.execute(
+                'SELECT id, name, parent_id, user_id FROM folders '
+                'WHERE user_id = ? AND parent_id = ? ORDER BY name',
                 (user_id, parent_id)
             )
         return cursor.fetchall()
@@ -570,45 +1092,48 @@ def get_user_folders(user_id, parent_id=None):
 
 def get_folder_by_id(folder_id):
     """Récupère un dossier par son ID"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM folders WHERE id = ?', (folder_id,))
-        return cursor.fetchone()
+    with get_db_connection(readonly=True) as conn:
+        return conn.execute(
+            'SELECT id, name, parent_id, user_id FROM folders WHERE id = ?', (folder_id,)
+        ).fetchone()
 
 
 def rename_folder(folder_id, new_name):
     """Renomme un dossier"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('UPDATE folders SET name = ? WHERE id = ?', (new_name, folder_id))
+        conn.execute('UPDATE folders SET name = ? WHERE id = ?', (new_name, folder_id))
 
 
 def delete_folder(folder_id):
     """Supprime un dossier et tous ses sous-dossiers (CASCADE)"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM folders WHERE id = ?', (folder_id,))
+        conn.execute('DELETE FROM folders WHERE id = ?', (folder_id,))
+    # folder_id des decks concernés remis à NULL (ON DELETE SET NULL)
+    get_deck_by_name.cache_clear()
 
 
 def move_deck_to_folder(deck_id, folder_id):
     """Déplace un deck dans un dossier"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('UPDATE decks SET folder_id = ? WHERE id = ?', (folder_id, deck_id))
+        conn.execute('UPDATE decks SET folder_id = ? WHERE id = ?', (folder_id, deck_id))
+    get_deck_by_name.cache_clear()
 
 
 def get_decks_in_folder(user_id, folder_id=None):
     """Récupère les decks dans un dossier (ou à la racine si folder_id=None)"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
+    with get_db_connection(readonly=True) as conn:
         if folder_id is None:
-            cursor.execute(
-                'SELECT * FROM decks WHERE user_id = ? AND (folder_id IS NULL OR folder_id NOT IN (SELECT id FROM folders)) ORDER BY created_at DESC',
-                (user_id,)
-            )
+            # Racine : decks sans dossier, ou dont le dossier n'existe plus
+            cursor = conn.execute('''
+                SELECT d.id, d.name, d.user_id, d.folder_id FROM decks d
+                LEFT JOIN folders fo ON fo.id = d.folder_id
+                WHERE d.user_id = ? AND (d.folder_id IS NULL OR fo.id IS NULL)
+                ORDER BY d.created_at DESC
+            ''', (user_id,))
         else:
-            cursor.execute(
-                'SELECT * FROM decks WHERE user_id = ? AND folder_id = ? ORDER BY created_at DESC',
+            cursor = conn.execute(
+                'SELECT id, name, user_id, folder_id FROM decks '
+                'WHERE user_id = ? AND folder_id = ? ORDER BY created_at DESC',
                 (user_id, folder_id)
             )
         return cursor.fetchall()
@@ -616,327 +1141,240 @@ def get_decks_in_folder(user_id, folder_id=None):
 
 def get_folder_statistics(user_id, folder_id):
     """Récupère les statistiques d'un dossier (nouvelles/réapprendre/réviser)"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        # Cartes nouvelles dans ce dossier
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as new_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ? AND d.folder_id = ? AND up.id IS NULL
-        ''', (user_id, user_id, folder_id))
-        new_count = cursor.fetchone()['new_cards']
-
-        # Cartes à réapprendre dans ce dossier
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as relearn_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ? AND d.folder_id = ?
-            AND up.is_learning = 1
-            AND up.due_date <= datetime('now')
-        ''', (user_id, user_id, folder_id))
-        relearn_count = cursor.fetchone()['relearn_cards']
-
-        # Cartes à réviser dans ce dossier
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as review_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ? AND d.folder_id = ?
-            AND up.is_learning = 0
-            AND up.due_date <= datetime('now')
-        ''', (user_id, user_id, folder_id))
-        review_count = cursor.fetchone()['review_cards']
-
-        return {
-            'new': new_count,
-            'relearn': relearn_count,
-            'review': review_count
-        }
+    with get_db_connection(readonly=True) as conn:
+        now = _now_epoch()
+        return _counts_dict(conn.execute(_SQL_FOLDER_COUNTS,
+                                         (now, now, user_id, user_id, folder_id)).fetchone())
 
 
 def get_deck_statistics(user_id, deck_id):
     """Récupère les statistiques d'un deck (nouvelles/réapprendre/réviser)"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
+    with get_db_connection(readonly=True) as conn:
+        now = _now_epoch()
+        return _counts_dict(conn.execute(_SQL_DECK_COUNTS, (now, now, user_id, deck_id)).fetchone())
 
-        # Cartes nouvelles dans ce deck
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as new_cards
-            FROM flashcards f
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE f.deck_id = ? AND up.id IS NULL
-        ''', (user_id, deck_id))
-        new_count = cursor.fetchone()['new_cards']
-
-        # Cartes à réapprendre dans ce deck
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as relearn_cards
-            FROM flashcards f
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE f.deck_id = ?
-            AND up.is_learning = 1
-            AND up.due_date <= datetime('now')
-        ''', (user_id, deck_id))
-        relearn_count = cursor.fetchone()['relearn_cards']
-
-        # Cartes à réviser dans ce deck
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as review_cards
-            FROM flashcards f
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE f.deck_id = ?
-            AND up.is_learning = 0
-            AND up.due_date <= datetime('now')
-        ''', (user_id, deck_id))
-        review_count = cursor.fetchone()['review_cards']
 
-        return {
-            'new': new_count,
-            'relearn': relearn_count,
-            'review': review_count
-        }
+def get_user_deck_statistics(user_id):
+    """Récupère les statistiques de tous les decks d'un utilisateur, par id de deck
+
+    Les decks sans carte n'apparaissent pas dans le dictionnaire.
+    """
+    now = _now_epoch()
+    with get_db_connection(readonly=True) as conn:
+        rows = conn.execute(_SQL_USER_DECK_COUNTS, (now, now, user_id, user_id)).fetchall()
+    return {row['deck_id']: _counts_dict(row) for row in rows}
 
 
 # --- FONCTIONS POUR LES STREAKS ---
 
-def update_daily_activity(user_id, cards_reviewed, all_completed):
+# Activité du jour en une seule requête : le nombre de cartes dues est
+# calculé par une sous-requête dans l'UPSERT
+_SQL_UPDATE_DAILY_ACTIVITY = '''
+    INSERT INTO daily_activity
+        (user_id, date, cards_reviewed, cards_due_completed, all_cards_completed)
+    VALUES (?, ?, ?, (
+        SELECT COUNT(f.id)
+        FROM flashcards f
+        INNER JOIN decks d ON f.deck_id = d.id
+        LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
+        WHERE d.user_id = ?
+        AND (up.due_epoch IS NULL OR up.due_epoch <= ?)
+    ), ?)
+    ON CONFLICT(user_id, date)
+    DO UPDATE SET
+        cards_reviewed = cards_reviewed + excluded.cards_reviewed,
+        cards_due_completed = excluded.cards_due_completed,
+        all_cards_completed = excluded.all_cards_completed
+'''
+
+
+def update_daily_activity(user_id, cards_reviewed, all_completed, conn=None):
     """Met à jour l'activité quotidienne de l'utilisateur"""
-    from datetime import datetime, date
-
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        today = date.today()
-
-        # Récupérer le nombre de cartes dues aujourd'hui
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as cards_due
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ?
-            AND (up.due_date IS NULL OR up.due_date <= datetime('now'))
-        ''', (user_id, user_id))
-        cards_due = cursor.fetchone()['cards_due']
-
-        # Mettre à jour ou créer l'entrée du jour
-        cursor.execute('''
-            INSERT INTO daily_activity
-                (user_id, date, cards_reviewed, cards_due_completed, all_cards_completed)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(user_id, date)
-            DO UPDATE SET
-                cards_reviewed = cards_reviewed + ?,
-                cards_due_completed = ?,
-                all_cards_completed = ?
-        ''', (user_id, today, cards_reviewed, cards_due, all_completed,
-              cards_reviewed, cards_due, all_completed))
-
-        # Mettre à jour le streak si toutes les cartes sont terminées
-        if all_completed:
-            update_streak(user_id)
-
-
-def update_streak(user_id):
-    """Met à jour le streak de l'utilisateur"""
-    from datetime import datetime, date, timedelta
-
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        today = date.today()
-
-        # Récupérer les infos actuelles de streak
-        cursor.execute(
-            'SELECT streak_count, last_streak_date FROM users WHERE id = ?',
-            (user_id,)
-        )
-        result = cursor.fetchone()
-        current_streak = result['streak_count'] or 0
-        last_date = result['last_streak_date']
-
-        # Si c'est le premier streak ou si last_date est None
-        if not last_date:
-            cursor.execute(
-                'UPDATE users SET streak_count = 1, last_streak_date = ? WHERE id = ?',
-                (today, user_id)
-            )
-            return 1
-
-        # Convertir last_date en objet date
-        if isinstance(last_date, str):
-            last_date = datetime.strptime(last_date, '%Y-%m-%d').date()
-
-        # Si c'était hier, on incrémente
-        if last_date == today - timedelta(days=1):
-            new_streak = current_streak + 1
-            cursor.execute(
-                'UPDATE users SET streak_count = ?, last_streak_date = ? WHERE id = ?',
-                (new_streak, today, user_id)
-            )
-            return new_streak
-        # Si c'est aujourd'hui, on garde le même
-        elif last_date == today:
-            return current_streak
-        # Sinon, le streak est cassé, on recommence à 1
-        else:
-            cursor.execute(
-                'UPDATE users SET streak_count = 1, last_streak_date = ? WHERE id = ?',
-                (today, user_id)
-            )
-            return 1
+    with _connection(conn) as conn:
+        conn.execute(_SQL_UPDATE_DAILY_ACTIVITY, (
+            user_id, date.today().isoformat(), cards_reviewed,
+            user_id, user_id, _now_epoch(),
+            all_completed
+        ))
+        # Le streak est mis à jour par les triggers trg_streak_on_* du schéma
+        conn.after_commit.append(lambda: get_user_streak.invalidate(user_id))
 
 
+@_cached_per_user
 def get_user_streak(user_id):
     """Récupère le streak actuel de l'utilisateur"""
-    from datetime import date, timedelta
-
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    with get_db_connection(readonly=True) as conn:
+        result = conn.execute(
             'SELECT streak_count, last_streak_date FROM users WHERE id = ?',
             (user_id,)
-        )
-        result = cursor.fetchone()
-
-        if not result:
-            return 0
-
-        streak = result['streak_count'] or 0
-        last_date = result['last_streak_date']
+        ).fetchone()
 
-        # Si pas de date ou si la dernière date est trop ancienne (> 1 jour), streak = 0
-        if not last_date:
-            return 0
+    # Pas de date : aucun streak
+    if not result or not result['last_streak_date']:
+        return 0
 
-        from datetime import datetime
-        if isinstance(last_date, str):
-            last_date = datetime.strptime(last_date, '%Y-%m-%d').date()
+    # Dernière date aujourd'hui ou hier : le streak est toujours en cours
+    # (dates ISO, comparables comme des chaînes)
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    if result['last_streak_date'] >= yesterday:
+        return result['streak_count'] or 0
 
-        # Si la dernière date n'est pas aujourd'hui ou hier, le streak est cassé
-        today = date.today()
-        if last_date < today - timedelta(days=1):
-            # Réinitialiser le streak
-            cursor.execute(
-                'UPDATE users SET streak_count = 0 WHERE id = ?',
-                (user_id,)
-            )
-            return 0
-
-        return streak
+    # Sinon le streak est cassé : remise à zéro, en écriture seulement dans ce cas
+    with get_db_connection() as conn:
+        conn.execute(
+            'UPDATE users SET streak_count = 0 WHERE id = ? AND last_streak_date < ?',
+            (user_id, yesterday)
+        )
+    return 0
 
 
 def get_yearly_activity(user_id, year=None):
     """Récupère l'activité de l'utilisateur pour une année complète"""
-    from datetime import datetime, date
-
     if year is None:
         year = date.today().year
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        # Récupérer toutes les activités de l'année
-        cursor.execute('''
-            SELECT date, cards_reviewed, all_cards_completed
+    with get_db_connection(readonly=True) as conn:
+        # Récupérer toutes les activités de l'année, avec le maximum de
+        # l'année sur chaque ligne (fonction de fenêtre). Intervalle de dates
+        # plutôt que strftime('%Y', date) : parcours de l'index (user_id, date)
+        activities = conn.execute('''
+            SELECT date, cards_reviewed, all_cards_completed,
+                   MAX(cards_reviewed) OVER () as max_cards
             FROM daily_activity
             WHERE user_id = ?
-            AND strftime('%Y', date) = ?
+            AND date >= ? AND date < ?
             ORDER BY date
-        ''', (user_id, str(year)))
+        ''', (user_id, f'{year}-01-01', f'{year + 1}-01-01')).fetchall()
 
-        activities = cursor.fetchall()
+    # Créer un dictionnaire pour un accès facile
+    activity_dict = {
+        activity['date']: {
+            'cards_reviewed': activity['cards_reviewed'],
+            'all_completed': activity['all_cards_completed']
+        }
+        for activity in activities
+    }
+
+    # Au moins 1, pour éviter la division par zéro
+    max_cards = max(activities[0]['max_cards'], 1) if activities else 1
+
+    return activity_dict, max_cards
+
+
+# Le classement agrège l'activité de tous les utilisateurs : il est stocké
+# dans leaderboard_cache (partagé entre processus) et recalculé au plus une
+# fois par LEADERBOARD_TTL secondes, un léger retard est acceptable
+LEADERBOARD_TTL = 60
+_leaderboard_cache = None  # (instant du calcul, lignes), copie en mémoire
+
+# Score = cartes révisées totales × streak
+_SQL_REFRESH_LEADERBOARD = '''
+    INSERT INTO leaderboard_cache
+        (rank, user_id, username, streak_count, total_cards, score, refreshed_at)
+    SELECT
+        ROW_NUMBER() OVER (ORDER BY score DESC, streak_count DESC),
+        id, username, streak_count, total_cards, score, ?
+    FROM (
+        -- total_cards est maintenu par les triggers de daily_activity
+        SELECT
+            id,
+            username,
+            streak_count,
+            COALESCE(total_cards, 0) as total_cards,
+            COALESCE(total_cards, 0) * COALESCE(streak_count, 0) as score
+        FROM users
+        WHERE show_in_leaderboard = 1
+        ORDER BY COALESCE(total_cards, 0) * COALESCE(streak_count, 0) DESC, streak_count DESC
+        LIMIT 100
+    )
+'''
+
+_SQL_LEADERBOARD = '''
+    SELECT user_id as id, username, streak_count, total_cards, score, refreshed_at
+    FROM leaderboard_cache
+    ORDER BY rank
+'''
+
+
+def _invalidate_leaderboard():
+    """Force le recalcul du classement au prochain appel"""
+    global _leaderboard_cache
+    _leaderboard_cache = None
+
+
+def refresh_leaderboard():
+    """Recalcule le classement stocké dans leaderboard_cache"""
+    with get_db_connection() as conn:
+        conn.execute('DELETE FROM leaderboard_cache')
+        conn.execute(_SQL_REFRESH_LEADERBOARD, (_now_epoch(),))
+    _invalidate_leaderboard()
 
-        # Créer un dictionnaire pour un accès facile
-        activity_dict = {}
-        max_cards = 1  # Pour éviter la division par zéro
 
-        for activity in activities:
-            activity_dict[activity['date']] = {
-                'cards_reviewed': activity['cards_reviewed'],
-                'all_completed': activity['all_cards_completed']
-            }
-            if activity['cards_reviewed'] > max_cards:
-                max_cards = activity['cards_reviewed']
+def get_leaderboard():
+    """Récupère le classement des utilisateurs"""
+    global _leaderboard_cache
+    cached = _leaderboard_cache
+    if cached is not None and time.monotonic() - cached[0] < LEADERBOARD_TTL:
+        return cached[1]
 
-        return activity_dict, max_cards
+    with get_db_connection(readonly=True) as conn:
+        rows = conn.execute(_SQL_LEADERBOARD).fetchall()
 
+    # Classement absent ou trop ancien : recalcul (paresseux, à la lecture)
+    if not rows or rows[0]['refreshed_at'] < _now_epoch() - LEADERBOARD_TTL:
+        refresh_leaderboard()
+        with get_db_connection(readonly=True) as conn:
+            rows = conn.execute(_SQL_LEADERBOARD).fetchall()
 
-def get_leaderboard():
-    """Récupère le classement des utilisateurs"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
+    _leaderboard_cache = (time.monotonic(), rows)
+    return rows
 
-        # Calculer le score (cartes révisées totales × streak)
-        cursor.execute('''
-            SELECT
-                u.id,
-                u.username,
-                u.streak_count,
-                COALESCE(SUM(da.cards_reviewed), 0) as total_cards,
-                (COALESCE(SUM(da.cards_reviewed), 0) * COALESCE(u.streak_count, 0)) as score
-            FROM users u
-            LEFT JOIN daily_activity da ON u.id = da.user_id
-            WHERE u.show_in_leaderboard = 1
-            GROUP BY u.id, u.username, u.streak_count
-            ORDER BY score DESC, u.streak_count DESC
-            LIMIT 100
-        ''')
 
-        return cursor.fetchall()
+# Inverse la visibilité en une seule requête (NULL compte comme masqué)
+_SQL_TOGGLE_LEADERBOARD = '''
+    UPDATE users SET show_in_leaderboard = CASE WHEN show_in_leaderboard THEN 0 ELSE 1 END
+    WHERE id = ?
+'''
 
 
 def toggle_leaderboard_visibility(user_id):
     """Active/désactive la visibilité de l'utilisateur dans le classement"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        # Récupérer l'état actuel
-        cursor.execute(
-            'SELECT show_in_leaderboard FROM users WHERE id = ?',
-            (user_id,)
-        )
-        result = cursor.fetchone()
-        current = result['show_in_leaderboard'] if result else 1
-
-        # Inverser
-        new_value = 0 if current else 1
-        cursor.execute(
-            'UPDATE users SET show_in_leaderboard = ? WHERE id = ?',
-            (new_value, user_id)
-        )
-
-        return new_value
-
+        if _HAS_RETURNING:
+            result = conn.execute(
+                _SQL_TOGGLE_LEADERBOARD + ' RETURNING show_in_leaderboard', (user_id,)
+            ).fetchone()
+        else:
+            conn.execute(_SQL_TOGGLE_LEADERBOARD, (user_id,))
+            result = conn.execute(
+                'SELECT show_in_leaderboard FROM users WHERE id = ?', (user_id,)
+            ).fetchone()
+        new_value = result['show_in_leaderboard'] if result else 0
+        # Classement stocké périmé : recalculé à la prochaine lecture
+        conn.execute('DELETE FROM leaderboard_cache')
 
-def can_see_leaderboard(user_id):
-    """Vérifie si l'utilisateur peut voir le classement"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT show_in_leaderboard FROM users WHERE id = ?',
-            (user_id,)
-        )
-        result = cursor.fetchone()
-        return result['show_in_leaderboard'] == 1 if result else False
+    # L'utilisateur doit apparaître (ou disparaître) immédiatement
+    get_show_in_leaderboard.invalidate(user_id)
+    _invalidate_leaderboard()
+    return new_value
 
 
+@_cached_per_user
 def get_show_in_leaderboard(user_id):
     """Récupère l'état de visibilité de l'utilisateur dans le classement"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    with get_db_connection(readonly=True) as conn:
+        result = conn.execute(
             'SELECT show_in_leaderboard FROM users WHERE id = ?',
             (user_id,)
-        )
-        result = cursor.fetchone()
+        ).fetchone()
         return result['show_in_leaderboard'] if result else 0
 
 
+def can_see_leaderboard(user_id):
+    """Vérifie si l'utilisateur peut voir le classement (seulement s'il y apparaît)"""
+    return get_show_in_leaderboard(user_id) == 1
+
+
 if __name__ == '__main__':
     # Initialiser la base de données
     init_database()
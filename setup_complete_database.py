@@ -8,7 +8,6 @@ from datetime import datetime, timedelta
 import random
 from werkzeug.security import generate_password_hash
 import os
-import shutil
 from database import init_database  
 
 
@@ -17,6 +16,8 @@ TEST_USERNAME = "test_user"
 TEST_PASSWORD = "test123"
 TEST_SECURITY_QUESTION = "Quelle est votre ville préférée ?"
 TEST_SECURITY_ANSWER = "Paris"
+# KDF légère : ce compte ne sert qu'au développement
+TEST_PASSWORD_HASH_METHOD = "pbkdf2:sha256:50000"
 
 # Données de test pour les flashcards
 SAMPLE_DECKS = [
@@ -106,6 +107,11 @@ def apply_migrations(conn):
     cursor = conn.cursor()
     print("\n🔧 Application des migrations...")
 
+    # Toutes les migrations dans une seule transaction (validée à la fin) :
+    # sans BEGIN explicite, chaque ALTER TABLE serait validé séparément
+    if not conn.in_transaction:
+        cursor.execute("BEGIN IMMEDIATE")
+
     # Migration 1: Questions de sécurité
     if not check_column_exists(cursor, 'users', 'security_question'):
         print("  📝 Ajout des questions de sécurité...")
@@ -189,8 +195,9 @@ def create_test_account(conn):
 
         # 2. Créer l'utilisateur
         print(f"👤 Création de l'utilisateur '{TEST_USERNAME}'...")
-        password_hash = generate_password_hash(TEST_PASSWORD)
-        security_answer_hash = generate_password_hash(TEST_SECURITY_ANSWER.lower())
+        password_hash = generate_password_hash(TEST_PASSWORD, method=TEST_PASSWORD_HASH_METHOD)
+        security_answer_hash = generate_password_hash(TEST_SECURITY_ANSWER.lower(),
+                                                      method=TEST_PASSWORD_HASH_METHOD)
 
         cursor.execute("""
             INSERT INTO users (username, password_hash, security_question, security_answer_hash,
@@ -293,6 +300,13 @@ def create_test_account(conn):
             """, (user_id, card_id, ease_factor, interval, due_date,
                   random.randint(0, 1), 1, random.randint(0, 2), last_reviewed))
 
+        # Échéances en secondes Unix, utilisées par les requêtes de statistiques
+        cursor.execute("""
+            UPDATE user_progress
+            SET due_epoch = CAST(strftime('%s', due_date, 'utc') AS INTEGER)
+            WHERE user_id = ? AND due_date IS NOT NULL
+        """, (user_id,))
+
         print(f"  ✅ Progression créée pour {len(mature_cards) + len(learning_cards) + len(new_cards)//2} cartes")
 
         # 5. Créer l'activité quotidienne pour le streak
@@ -376,11 +390,24 @@ if not os.path.exists("flashcards.db"):
     # Créer une sauvegarde
     backup_path = f"flashcards_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
     print(f"💾 Création d'une sauvegarde: {backup_path}")
-    shutil.copy2("flashcards.db", backup_path)
+    # API de sauvegarde de SQLite : une copie du seul fichier .db perdrait les
+    # pages encore dans le journal WAL (schéma écrit par init_database)
+    source = sqlite3.connect("flashcards.db")
+    backup = sqlite3.connect(backup_path)
+    try:
+        source.backup(backup)
+    finally:
+        backup.close()
+        source.close()
 
     # Connexion à la base de données
     conn = sqlite3.connect("flashcards.db")
     conn.execute('PRAGMA foreign_keys = ON')
+    # Mêmes réglages que les connexions de l'application (la base est en WAL
+    # depuis init_database) : pas de fsync à chaque commit, tris en mémoire
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -64000')
 
     try:
         # Appliquer les migrations
@@ -389,6 +416,10 @@ if not os.path.exists("flashcards.db"):
         # Créer le compte test
         create_test_account(conn)
 
+        # Statistiques du planificateur à jour après les migrations et
+        # l'insertion des données de test
+        conn.execute('ANALYZE')
+
         print("\n🎉 Configuration terminée avec succès!")
         print("\n⚠️  N'oubliez pas de REDÉMARRER votre serveur Flask!\n")
 
@@ -19,11 +19,14 @@ from werkzeug.security import generate_password_hash
 # Importer toutes les fonctions à tester
 import database
 from database import (
-    init_database, set_database_path,
+    init_database, set_database_path, close_db_connections,
     create_user, get_user_by_username, get_all_users,
     create_deck, get_deck_by_name, get_all_decks, delete_deck,
-    create_flashcard, get_flashcards_by_deck, get_flashcard_by_id,
-    get_user_progress, update_progress, get_all_user_progress
+    create_flashcard, create_flashcards_bulk, get_flashcards_by_deck, get_flashcard_by_id,
+    iter_flashcards_by_deck, transaction,
+    get_user_progress, update_progress, get_all_user_progress,
+    get_user_streak, update_daily_activity,
+    get_leaderboard, toggle_leaderboard_visibility
 )
 
 
@@ -57,7 +60,8 @@ class TestDatabase(unittest.TestCase):
 
     def tearDown(self):
         """Exécuté après chaque test - Nettoie la base de données temporaire"""
-        # Fermer et supprimer le fichier temporaire
+        # Fermer les connexions du pool, puis supprimer le fichier temporaire
+        close_db_connections()
         os.close(self.test_db_fd)
         os.unlink(self.test_db_path)
 
@@ -115,6 +119,17 @@ class TestUsers(TestDatabase):
         self.assertIn("user2", usernames)
         self.assertIn("user3", usernames)
 
+    def test_get_all_users_pagination(self):
+        """Test de la pagination par clé de get_all_users"""
+        for i in range(5):
+            create_user(f"user{i}", generate_password_hash("pass"))
+
+        first_page = get_all_users(limit=2)
+        self.assertEqual([user['username'] for user in first_page], ["user0", "user1"])
+
+        next_page = get_all_users(limit=2, after_id=first_page[-1]['id'])
+        self.assertEqual([user['username'] for user in next_page], ["user2", "user3"])
+
 
 class TestDecks(TestDatabase):
     """Tests pour les fonctions de gestion des decks"""
@@ -145,6 +160,23 @@ class TestDecks(TestDatabase):
         self.assertEqual(deck['id'], deck_id)
         self.assertEqual(deck['name'], "Test Deck")
 
+    def test_deck_cache_expires(self):
+        """Test qu'un deck supprimé par un autre processus disparaît du cache"""
+        create_deck("Test Deck")
+        self.assertIsNotNone(get_deck_by_name("Test Deck"))
+
+        # Suppression directe en SQL, sans passer par cache_clear()
+        with database.get_db_connection() as conn:
+            conn.execute('DELETE FROM decks WHERE name = ?', ("Test Deck",))
+        self.assertIsNotNone(get_deck_by_name("Test Deck"))
+
+        ttl = database.LOOKUP_CACHE_TTL
+        database.LOOKUP_CACHE_TTL = 0
+        try:
+            self.assertIsNone(get_deck_by_name("Test Deck"))
+        finally:
+            database.LOOKUP_CACHE_TTL = ttl
+
     def test_get_nonexistent_deck(self):
         """Test de récupération d'un deck inexistant"""
         deck = get_deck_by_name("Nonexistent Deck")
@@ -201,6 +233,18 @@ class TestFlashcards(TestDatabase):
         # Devrait retourner le même ID (question unique par deck)
         self.assertEqual(flashcard_id1, flashcard_id2)
 
+    def test_create_flashcards_bulk(self):
+        """Test de création groupée de flashcards (doublons ignorés)"""
+        deck_id = create_deck("Test Deck")
+        create_flashcard(deck_id, "Q1?", "A1")
+
+        inserted = create_flashcards_bulk(deck_id, [("Q1?", "Autre"), ("Q2?", "A2"), ("Q3?", "A3")])
+
+        self.assertEqual(inserted, 2)
+        flashcards = get_flashcards_by_deck(deck_id)
+        self.assertEqual([f['question'] for f in flashcards], ["Q1?", "Q2?", "Q3?"])
+        self.assertEqual(flashcards[0]['answer'], "A1")
+
     def test_get_flashcard_by_id(self):
         """Test de récupération d'une flashcard par ID"""
         deck_id = create_deck("Test Deck")
@@ -229,6 +273,43 @@ class TestFlashcards(TestDatabase):
         self.assertIn("Q2?", questions)
         self.assertIn("Q3?", questions)
 
+    def test_iter_flashcards_by_deck(self):
+        """Test du parcours par lots des flashcards d'un deck"""
+        deck_id = create_deck("Test Deck")
+        create_flashcards_bulk(deck_id, [(f"Q{i}?", f"A{i}") for i in range(5)])
+
+        questions = [fc['question'] for fc in iter_flashcards_by_deck(deck_id, batch_size=2)]
+
+        self.assertEqual(questions, [f"Q{i}?" for i in range(5)])
+
+    def test_transaction(self):
+        """Test que les écritures d'une transaction sont validées ou annulées ensemble"""
+        deck_id = create_deck("Test Deck")
+
+        with transaction() as conn:
+            create_flashcard(deck_id, "Q1?", "A1", conn=conn)
+            create_flashcard(deck_id, "Q2?", "A2", conn=conn)
+        self.assertEqual(len(get_flashcards_by_deck(deck_id)), 2)
+
+        with self.assertRaises(RuntimeError):
+            with transaction() as conn:
+                create_flashcard(deck_id, "Q3?", "A3", conn=conn)
+                raise RuntimeError("annulation")
+        self.assertEqual(len(get_flashcards_by_deck(deck_id)), 2)
+
+    def test_transaction_interrupted(self):
+        """Test qu'une interruption hors Exception ne laisse pas de transaction ouverte"""
+        deck_id = create_deck("Test Deck")
+
+        with self.assertRaises(KeyboardInterrupt):
+            with transaction() as conn:
+                create_flashcard(deck_id, "Q1?", "A1", conn=conn)
+                raise KeyboardInterrupt
+
+        # La connexion rendue au pool accepte une nouvelle transaction
+        create_flashcard(deck_id, "Q2?", "A2")
+        self.assertEqual([card['question'] for card in get_flashcards_by_deck(deck_id)], ["Q2?"])
+
     def test_flashcards_deleted_with_deck(self):
         """Test que les flashcards sont supprimées avec le deck (CASCADE)"""
         deck_id = create_deck("Test Deck")
@@ -338,6 +419,161 @@ class TestUserProgress(TestDatabase):
         self.assertEqual(progress2['score'], 5)
 
 
+class TestStreaks(TestDatabase):
+    """Tests pour les fonctions de gestion des streaks"""
+
+    def _set_last_streak(self, user_id, streak, days_ago):
+        """Place la dernière date de streak quelques jours dans le passé"""
+        from datetime import date, timedelta
+        last_date = (date.today() - timedelta(days=days_ago)).isoformat()
+        with database.get_db_connection() as conn:
+            conn.execute(
+                'UPDATE users SET streak_count = ?, last_streak_date = ? WHERE id = ?',
+                (streak, last_date, user_id)
+            )
+        # Écriture directe en SQL : le streak mis en cache n'est plus valable
+        get_user_streak.invalidate(user_id)
+
+    def test_update_streak(self):
+        """Test du premier jour, d'un jour consécutif et d'une série cassée"""
+        user_id = create_user("testuser", generate_password_hash("password"))
+
+        update_daily_activity(user_id, 1, True)
+        self.assertEqual(get_user_streak(user_id), 1)
+        # Deuxième session terminée le même jour : streak inchangé
+        update_daily_activity(user_id, 1, True)
+        self.assertEqual(get_user_streak(user_id), 1)
+
+        self._set_last_streak(user_id, 5, days_ago=1)
+        update_daily_activity(user_id, 1, True)
+        self.assertEqual(get_user_streak(user_id), 6)
+
+        self._set_last_streak(user_id, 5, days_ago=3)
+        update_daily_activity(user_id, 1, True)
+        self.assertEqual(get_user_streak(user_id), 1)
+
+    def test_get_user_streak(self):
+        """Test que le streak est remis à zéro lorsqu'il est cassé"""
+        user_id = create_user("testuser", generate_password_hash("password"))
+        self.assertEqual(get_user_streak(user_id), 0)
+
+        self._set_last_streak(user_id, 4, days_ago=1)
+        self.assertEqual(get_user_streak(user_id), 4)
+
+        self._set_last_streak(user_id, 4, days_ago=2)
+        self.assertEqual(get_user_streak(user_id), 0)
+        with database.get_db_connection() as conn:
+            streak = conn.execute(
+                'SELECT streak_count FROM users WHERE id = ?', (user_id,)
+            ).fetchone()['streak_count']
+        self.assertEqual(streak, 0)
+
+    def test_daily_activity_updates_streak(self):
+        """Test qu'une session terminée met à jour le streak"""
+        user_id = create_user("testuser", generate_password_hash("password"))
+        update_daily_activity(user_id, 10, True)
+        self.assertEqual(get_user_streak(user_id), 1)
+
+    def test_streak_cache_invalidated_after_commit(self):
+        """Test qu'une lecture pendant la transaction ne garde pas l'ancien streak"""
+        user_id = create_user("testuser", generate_password_hash("password"))
+        self.assertEqual(get_user_streak(user_id), 0)
+
+        with transaction() as conn:
+            update_daily_activity(user_id, 1, True, conn=conn)
+            # Lecture concurrente avant le commit : ancienne valeur remise en cache
+            self.assertEqual(get_user_streak(user_id), 0)
+
+        self.assertEqual(get_user_streak(user_id), 1)
+
+    def test_streak_trigger_on_upsert(self):
+        """Test que le trigger prolonge le streak quand la journée est terminée"""
+        user_id = create_user("testuser", generate_password_hash("password"))
+        self._set_last_streak(user_id, 5, days_ago=1)
+
+        # Journée commencée mais pas terminée : streak inchangé
+        update_daily_activity(user_id, 3, False)
+        self.assertEqual(get_user_streak(user_id), 5)
+
+        # La même ligne passe à terminée (branche UPDATE de l'UPSERT)
+        update_daily_activity(user_id, 2, True)
+        self.assertEqual(get_user_streak(user_id), 6)
+        update_daily_activity(user_id, 1, True)
+        self.assertEqual(get_user_streak(user_id), 6)
+
+
+class TestLeaderboard(TestDatabase):
+    """Tests pour le classement"""
+
+    def test_leaderboard_toggle_visibility(self):
+        """Test que le classement reflète immédiatement un changement de visibilité"""
+        alice_id = create_user("alice", generate_password_hash("pass"))
+        bob_id = create_user("bob", generate_password_hash("pass"))
+        update_daily_activity(alice_id, 5, True)
+        update_daily_activity(bob_id, 3, True)
+
+        leaderboard = get_leaderboard()
+        self.assertEqual([row['username'] for row in leaderboard], ["alice", "bob"])
+        self.assertEqual(leaderboard[0]['score'], 5)
+
+        # Bob se retire du classement : plus de recalcul en attente du TTL
+        self.assertEqual(toggle_leaderboard_visibility(bob_id), 0)
+        self.assertEqual([row['username'] for row in get_leaderboard()], ["alice"])
+
+    def test_show_in_leaderboard_cache(self):
+        """Test que la visibilité mise en cache suit les changements"""
+        user_id = create_user("alice", generate_password_hash("pass"))
+        self.assertEqual(database.get_show_in_leaderboard(user_id), 1)
+        toggle_leaderboard_visibility(user_id)
+        self.assertEqual(database.get_show_in_leaderboard(user_id), 0)
+
+    def test_leaderboard_total_cards(self):
+        """Test que le total de cartes suit chaque mise à jour de l'activité"""
+        user_id = create_user("alice", generate_password_hash("pass"))
+        update_daily_activity(user_id, 5, False)
+        update_daily_activity(user_id, 3, True)
+
+        database.refresh_leaderboard()
+        leaderboard = get_leaderboard()
+        self.assertEqual(leaderboard[0]['total_cards'], 8)
+        self.assertEqual(leaderboard[0]['score'], 8)
+
+
+class TestMigrations(TestDatabase):
+    """Tests de la mise à jour des anciennes bases"""
+
+    def test_migrate_users_only_database(self):
+        """Test d'une base antérieure aux streaks (table users seule)"""
+        import sqlite3
+        fd, legacy_path = tempfile.mkstemp(suffix='.db')
+        try:
+            legacy = sqlite3.connect(legacy_path)
+            legacy.execute(
+                'CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'username TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL, '
+                'created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+            )
+            legacy.execute("INSERT INTO users (username, password_hash) VALUES ('old', 'x')")
+            legacy.commit()
+            legacy.close()
+
+            set_database_path(legacy_path)
+            init_database()
+
+            user = get_user_by_username("old")
+            self.assertIsNotNone(user)
+            update_daily_activity(user['id'], 4, True)
+            self.assertEqual(get_user_streak(user['id']), 1)
+            self.assertEqual(get_leaderboard()[0]['total_cards'], 4)
+        finally:
+            close_db_connections()
+            os.close(fd)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(legacy_path + suffix):
+                    os.unlink(legacy_path + suffix)
+            set_database_path(self.test_db_path)
+
+
 class TestIntegration(TestDatabase):
     """Tests d'intégration - scénarios complets"""
 
@@ -417,6 +653,9 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestDecks))
     suite.addTests(loader.loadTestsFromTestCase(TestFlashcards))
     suite.addTests(loader.loadTestsFromTestCase(TestUserProgress))
+    suite.addTests(loader.loadTestsFromTestCase(TestStreaks))
+    suite.addTests(loader.loadTestsFromTestCase(TestLeaderboard))
+    suite.addTests(loader.loadTestsFromTestCase(TestMigrations))
     suite.addTests(loader.loadTestsFromTestCase(TestIntegration))
 
     # Exécuter les tests avec un rapport détaillé